@@ -0,0 +1,129 @@
+import csv
+import os
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.utils import timezone
+
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Tag
+)
+from users.models import Follow, User
+
+PASSWORD = 'benchmark-password'
+ACTIVITY_HOURS = 30 * 24
+INGREDIENTS_PATH = os.path.join(settings.BASE_DIR, 'data', 'ingredients.csv')
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+    ('Десерт', '#F7C948', 'dessert'),
+    ('Выпечка', '#B5651D', 'bakery'),
+    ('Напитки', '#2D9CDB', 'drinks'),
+)
+DISHES = (
+    'Суп', 'Салат', 'Рагу', 'Пирог', 'Запеканка', 'Омлет', 'Паста',
+    'Каша', 'Плов', 'Котлеты', 'Блины', 'Смузи', 'Лазанья', 'Борщ',
+)
+
+
+def ids(model):
+    return list(model.objects.order_by('pk').values_list('pk', flat=True))
+
+
+def load_ingredients():
+    with open(INGREDIENTS_PATH, encoding='utf-8') as file:
+        return [
+            Ingredient(name=name, measurement_unit=unit)
+            for name, unit in csv.reader(file)
+        ]
+
+
+def seed(rng, users=100, recipes=1000, follows=20, favorites=30,
+         carts=10):
+    """
+    Заполняет БД связанными данными пачками bulk_create.
+
+    Размер пачки выбирает бэкенд БД: у SQLite он ограничен числом
+    параметров запроса. Сигналы при этом не срабатывают, поэтому счётчики,
+    списки покупок, полнотекстовый индекс и оценки рецептов
+    пересчитываются командами в конце. Время добавления в избранное и
+    корзины разнесено на ACTIVITY_HOURS часов назад.
+    Одинаковый rng даёт одинаковый набор данных.
+    """
+    password = make_password(PASSWORD)
+    User.objects.bulk_create([
+        User(
+            username=f'user{number}',
+            email=f'user{number}@example.com',
+            first_name=f'Имя{number}',
+            last_name=f'Фамилия{number}',
+            password=password,
+        )
+        for number in range(users)
+    ])
+    Ingredient.objects.bulk_create(load_ingredients(), ignore_conflicts=True)
+    Tag.objects.bulk_create([
+        Tag(name=name, color=color, slug=slug) for name, color, slug in TAGS
+    ])
+    user_ids = ids(User)
+    ingredient_ids = ids(Ingredient)
+    tag_ids = ids(Tag)
+
+    Recipe.objects.bulk_create([
+        Recipe(
+            author_id=rng.choice(user_ids),
+            name=f'{rng.choice(DISHES)} №{number}',
+            text=' '.join(rng.choice(DISHES).lower() for _ in range(30)),
+            cooking_time=rng.randint(5, 180),
+        )
+        for number in range(recipes)
+    ])
+    recipe_ids = ids(Recipe)
+    RecipeIngredient.objects.bulk_create([
+        RecipeIngredient(
+            recipe_id=recipe_id,
+            ingredient_id=ingredient_id,
+            amount=rng.randint(1, 500),
+        )
+        for recipe_id in recipe_ids
+        for ingredient_id in rng.sample(ingredient_ids, rng.randint(5, 20))
+    ])
+    Recipe.tags.through.objects.bulk_create([
+        Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+        for recipe_id in recipe_ids
+        for tag_id in rng.sample(tag_ids, rng.randint(1, 3))
+    ])
+
+    Follow.objects.bulk_create([
+        Follow(follower_id=user_id, author_id=author_id)
+        for user_id in user_ids
+        for author_id in rng.sample(user_ids, rng.randint(0, follows))
+        if author_id != user_id
+    ])
+    now = timezone.now()
+    for model, limit in ((Favorite, favorites), (ShoppingCart, carts)):
+        model.objects.bulk_create([
+            model(
+                user_id=user_id,
+                recipe_id=recipe_id,
+                created=now - timedelta(
+                    hours=(user_id * 31 + recipe_id) % ACTIVITY_HOURS
+                )
+            )
+            for user_id in user_ids
+            for recipe_id in rng.sample(recipe_ids, rng.randint(0, limit))
+        ])
+
+    call_command('recount', stdout=StringIO())
+    call_command('rebuild_shopping_lists', stdout=StringIO())
+    call_command('reindex_search', stdout=StringIO())
+    call_command('update_recipe_scores', full=True, stdout=StringIO())
@@ -0,0 +1,81 @@
+import math
+import time
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+NOISE_FLOOR_MS = 1.0
+
+
+class UnexpectedStatusError(Exception):
+    pass
+
+
+def percentile(values, percent):
+    """Перцентиль методом ближайшего ранга по отсортированному списку."""
+    rank = math.ceil(percent / 100 * len(values))
+    return values[max(rank - 1, 0)]
+
+
+def run_scenario(scenario, context, iterations, warmup):
+    """
+    Последовательно выполняет сценарий и возвращает сводку по нему.
+
+    Первые warmup запросов прогревают кэши и в статистику не попадают.
+    Число запросов к БД считается для каждого запроса отдельно.
+    """
+    client = Client()
+    durations = []
+    queries = []
+    for iteration in range(warmup + iterations):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = scenario.request(client, context)
+            duration = time.perf_counter() - started
+        if response.status_code != scenario.status:
+            raise UnexpectedStatusError(
+                f'{scenario.name}: expected {scenario.status}, '
+                f'got {response.status_code}'
+            )
+        if iteration >= warmup:
+            durations.append(duration)
+            queries.append(len(captured))
+    durations.sort()
+    queries.sort()
+    return {
+        'requests': iterations,
+        'p50_ms': round(percentile(durations, 50) * 1000, 2),
+        'p95_ms': round(percentile(durations, 95) * 1000, 2),
+        'p99_ms': round(percentile(durations, 99) * 1000, 2),
+        'rps': round(iterations / sum(durations), 1),
+        'queries_p50': percentile(queries, 50),
+        'queries_max': queries[-1],
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Список регрессий относительно сохранённых результатов.
+
+    Рост числа запросов к БД считается регрессией всегда, рост p95 - если
+    он больше tolerance и больше шума в NOISE_FLOOR_MS миллисекунд.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if current['queries_max'] > previous['queries_max']:
+            regressions.append(
+                f'{name}: queries {previous["queries_max"]} -> '
+                f'{current["queries_max"]}'
+            )
+        growth = current['p95_ms'] - previous['p95_ms']
+        if (growth > NOISE_FLOOR_MS
+                and growth > previous['p95_ms'] * tolerance):
+            regressions.append(
+                f'{name}: p95 {previous["p95_ms"]} ms -> '
+                f'{current["p95_ms"]} ms'
+            )
+    return regressions
@@ -0,0 +1,174 @@
+import json
+
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+from .factories import DISHES
+
+PAGE_SIZE = 6
+AUTH_USERS = 10
+
+
+class Context:
+    """Данные, из которых сценарии выбирают параметры запросов."""
+
+    def __init__(self, rng):
+        self.rng = rng
+        authors = User.objects.filter(recipes_count__gt=0).order_by(
+            '-followers_count', 'pk'
+        )[:AUTH_USERS]
+        self.tokens = {
+            user.pk: Token.objects.get_or_create(user=user)[0].key
+            for user in authors
+        }
+        self.own_recipes = {
+            user_id: list(Recipe.objects.filter(
+                author_id=user_id
+            ).values_list('pk', flat=True))
+            for user_id in self.tokens
+        }
+        self.recipe_ids = list(Recipe.objects.values_list('pk', flat=True))
+        self.author_ids = list(self.tokens)
+        self.tag_slugs = list(Tag.objects.values_list('slug', flat=True))
+        self.tag_ids = list(Tag.objects.values_list('pk', flat=True))
+        self.ingredient_ids = list(
+            Ingredient.objects.values_list('pk', flat=True)
+        )
+        self.ingredient_names = list(
+            Ingredient.objects.values_list('name', flat=True)
+        )
+        self.pages = max(len(self.recipe_ids) // PAGE_SIZE, 1)
+
+    def user(self):
+        return self.rng.choice(self.author_ids)
+
+    def recipe_payload(self, name):
+        return {
+            'name': name,
+            'text': 'Рецепт для нагрузочного теста.',
+            'cooking_time': self.rng.randint(5, 180),
+            'tags': self.rng.sample(self.tag_ids, 2),
+            'ingredients': [
+                {'id': ingredient_id, 'amount': self.rng.randint(1, 500)}
+                for ingredient_id in self.rng.sample(
+                    self.ingredient_ids, self.rng.randint(5, 20)
+                )
+            ],
+        }
+
+
+class Scenario:
+    """
+    Запрос к одному эндпоинту.
+
+    build(context) возвращает (id пользователя или None, путь, тело).
+    """
+
+    def __init__(self, name, method, build, status=200):
+        self.name = name
+        self.method = method
+        self.build = build
+        self.status = status
+
+    def request(self, client, context):
+        user_id, path, data = self.build(context)
+        kwargs = {}
+        if user_id is not None:
+            kwargs['HTTP_AUTHORIZATION'] = f'Token {context.tokens[user_id]}'
+        if data is not None:
+            kwargs['data'] = json.dumps(data)
+            kwargs['content_type'] = 'application/json'
+        return getattr(client, self.method)(path, **kwargs)
+
+
+def recipes_list(context):
+    page = context.rng.randint(1, context.pages)
+    return None, f'/api/recipes/?page={page}&limit={PAGE_SIZE}', None
+
+
+def recipes_filtered(context):
+    rng = context.rng
+    filters = rng.choice((
+        f'tags={rng.choice(context.tag_slugs)}'
+        f'&tags={rng.choice(context.tag_slugs)}',
+        f'author={rng.choice(context.author_ids)}',
+        'is_favorited=1',
+        'is_in_shopping_cart=1',
+        f'search={rng.choice(DISHES)}',
+        'ordering=-favorites_count',
+    ))
+    return context.user(), f'/api/recipes/?{filters}&limit={PAGE_SIZE}', None
+
+
+def recipes_ranked(context):
+    ordering = context.rng.choice(('popular', 'trending'))
+    page = context.rng.randint(1, context.pages)
+    return (
+        context.user(),
+        f'/api/recipes/?ordering={ordering}&page={page}&limit={PAGE_SIZE}',
+        None
+    )
+
+
+def recipe_detail(context):
+    recipe_id = context.rng.choice(context.recipe_ids)
+    return context.user(), f'/api/recipes/{recipe_id}/', None
+
+
+def subscriptions(context):
+    return (
+        context.user(),
+        '/api/users/subscriptions/?recipes_limit=3',
+        None
+    )
+
+
+def shopping_cart(context):
+    export_format = context.rng.choice(('pdf', 'txt', 'csv'))
+    return (
+        context.user(),
+        f'/api/recipes/download_shopping_cart/?type={export_format}',
+        None
+    )
+
+
+def ingredient_autocomplete(context):
+    name = context.rng.choice(context.ingredient_names)
+    prefix = name[:context.rng.randint(1, 3)]
+    return None, f'/api/ingredients/?name={prefix}', None
+
+
+def recipe_create(context):
+    number = context.rng.randint(0, 10 ** 9)
+    return (
+        context.user(),
+        '/api/recipes/',
+        context.recipe_payload(f'Новый рецепт {number}')
+    )
+
+
+def recipe_update(context):
+    user_id = context.rng.choice([
+        user_id for user_id, recipes in context.own_recipes.items()
+        if recipes
+    ])
+    recipe_id = context.rng.choice(context.own_recipes[user_id])
+    return (
+        user_id,
+        f'/api/recipes/{recipe_id}/',
+        context.recipe_payload(f'Обновлённый рецепт {recipe_id}')
+    )
+
+
+SCENARIOS = (
+    Scenario('recipes_list_anonymous', 'get', recipes_list),
+    Scenario('recipes_list_filtered', 'get', recipes_filtered),
+    Scenario('recipes_list_ranked', 'get', recipes_ranked),
+    Scenario('recipe_detail', 'get', recipe_detail),
+    Scenario('subscriptions', 'get', subscriptions),
+    Scenario('download_shopping_cart', 'get', shopping_cart),
+    Scenario('ingredient_autocomplete', 'get', ingredient_autocomplete),
+    Scenario('recipe_create', 'post', recipe_create, status=201),
+    Scenario('recipe_update', 'patch', recipe_update),
+)
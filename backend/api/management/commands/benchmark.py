@@ -0,0 +1,170 @@
+import json
+import os
+import random
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment
+)
+
+from api.benchmark.factories import seed
+from api.benchmark.runner import UnexpectedStatusError, compare, run_scenario
+from api.benchmark.scenarios import SCENARIOS, Context
+
+BASELINES_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+    'benchmark',
+    'baselines'
+)
+COLUMNS = (
+    ('requests', 'n'),
+    ('p50_ms', 'p50 ms'),
+    ('p95_ms', 'p95 ms'),
+    ('p99_ms', 'p99 ms'),
+    ('rps', 'req/s'),
+    ('queries_p50', 'q p50'),
+    ('queries_max', 'q max'),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест основных эндпоинтов API на отдельной тестовой БД"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Зерно генератора данных и параметров запросов',
+        )
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--iterations', type=int, default=100)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument(
+            '--scenario',
+            action='append',
+            dest='scenarios',
+            choices=[scenario.name for scenario in SCENARIOS],
+            help='Запустить только указанные сценарии',
+        )
+        parser.add_argument(
+            '--baseline',
+            help='Файл с результатами для сравнения, по умолчанию '
+                 'api/benchmark/baselines/<СУБД>.json',
+        )
+        parser.add_argument(
+            '--save-baseline',
+            action='store_true',
+            help='Сохранить результаты как новые базовые',
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.2,
+            help='Допустимый относительный рост p95',
+        )
+        parser.add_argument(
+            '--strict',
+            action='store_true',
+            help='Завершиться с ошибкой при регрессии',
+        )
+
+    def handle(self, **options):
+        setup_test_environment(debug=False)
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            cache.clear()
+            report = self.run(options)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+        self.report(report, options)
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        sizes = {
+            'seed': options['seed'],
+            'users': options['users'],
+            'recipes': options['recipes'],
+        }
+        started = time.monotonic()
+        seed(rng, users=options['users'], recipes=options['recipes'])
+        self.stdout.write(
+            f'Seeded {connection.vendor} database '
+            f'in {time.monotonic() - started:.1f}s'
+        )
+        context = Context(rng)
+        results = {}
+        for scenario in SCENARIOS:
+            if (options['scenarios']
+                    and scenario.name not in options['scenarios']):
+                continue
+            try:
+                results[scenario.name] = run_scenario(
+                    scenario,
+                    context,
+                    options['iterations'],
+                    options['warmup']
+                )
+            except UnexpectedStatusError as error:
+                raise CommandError(error)
+        return {
+            'vendor': connection.vendor,
+            'dataset': sizes,
+            'results': results,
+        }
+
+    def report(self, report, options):
+        width = max(len(name) for name in report['results'])
+        self.stdout.write(
+            'endpoint'.ljust(width)
+            + ''.join(title.rjust(9) for _, title in COLUMNS)
+        )
+        for name, result in report['results'].items():
+            self.stdout.write(
+                name.ljust(width)
+                + ''.join(str(result[key]).rjust(9) for key, _ in COLUMNS)
+            )
+        path = options['baseline'] or os.path.join(
+            BASELINES_DIR, f'{report["vendor"]}.json'
+        )
+        if options['save_baseline']:
+            with open(path, 'w', encoding='utf-8') as file:
+                json.dump(report, file, indent=2, ensure_ascii=False)
+                file.write('\n')
+            self.stdout.write(self.style.SUCCESS(f'Baseline saved to {path}'))
+            return
+        if not os.path.exists(path):
+            self.stdout.write(self.style.WARNING(f'No baseline at {path}'))
+            return
+        with open(path, encoding='utf-8') as file:
+            baseline = json.load(file)
+        if baseline['dataset'] != report['dataset']:
+            self.stdout.write(self.style.WARNING(
+                f'Baseline {path} was recorded on another dataset '
+                f'{baseline["dataset"]}, comparison skipped'
+            ))
+            return
+        regressions = compare(
+            report['results'],
+            baseline['results'],
+            options['tolerance']
+        )
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS(
+                f'No regressions against {path}'
+            ))
+            return
+        for regression in regressions:
+            self.stdout.write(self.style.ERROR(regression))
+        if options['strict']:
+            raise CommandError(f'{len(regressions)} regressions found')
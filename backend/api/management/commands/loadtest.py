@@ -0,0 +1,64 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import local
+
+from django.core.management.base import BaseCommand, CommandError
+
+import requests
+
+from api.benchmark.runner import percentile
+
+_session = local()
+
+
+def fetch(url, headers):
+    if not hasattr(_session, 'value'):
+        _session.value = requests.Session()
+    started = time.perf_counter()
+    try:
+        status = _session.value.get(url, headers=headers, timeout=30)
+        status = status.status_code
+    except requests.RequestException:
+        status = None
+    return status, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = (
+        "Параллельная нагрузка на запущенный сервер: запросы в секунду и "
+        "перцентили задержки"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+', help='Адреса для запросов')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument(
+            '--token',
+            help='Токен для заголовка Authorization',
+        )
+
+    def handle(self, urls, concurrency, token=None, **options):
+        headers = {'Authorization': f'Token {token}'} if token else {}
+        total = options['requests']
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(
+                lambda number: fetch(urls[number % len(urls)], headers),
+                range(total)
+            ))
+        elapsed = time.perf_counter() - started
+        errors = sum(
+            1 for status, _ in results if status is None or status >= 400
+        )
+        if errors == total:
+            raise CommandError('All requests failed')
+        durations = sorted(duration for _, duration in results)
+        self.stdout.write(
+            f'{total} requests, concurrency {concurrency}, '
+            f'{errors} errors\n'
+            f'{total / elapsed:.1f} req/s, '
+            f'p50 {percentile(durations, 50) * 1000:.1f} ms, '
+            f'p95 {percentile(durations, 95) * 1000:.1f} ms, '
+            f'p99 {percentile(durations, 99) * 1000:.1f} ms'
+        )
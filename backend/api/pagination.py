@@ -1,5 +1,198 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from functools import reduce
+from operator import and_, or_
+
+from django.db.models import DateTimeField, Q, QuerySet
+from django.utils.dateparse import parse_datetime
+
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Пагинация по ключу сортировки без OFFSET и COUNT(*).
+
+    Курсор содержит значения полей ordering последнего объекта страницы,
+    следующая страница выбирается условием "строго после курсора", поэтому
+    стоимость запроса не зависит от глубины прокрутки.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 100
+    ordering = ('-pub_date', '-id')
+    ordering_query_param = api_settings.ORDERING_PARAM
+    # Параметры со своим порядком выдачи, который курсор не сохраняет.
+    ranked_query_params = ('search',)
+    invalid_cursor_message = 'Invalid cursor'
+    invalid_ordering_message = (
+        'Cursor pagination supports only the default ordering'
+    )
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_ordering(self, view):
+        return getattr(view, 'cursor_ordering', self.ordering)
+
+    @staticmethod
+    def encode_value(value):
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return str(value)
+
+    @staticmethod
+    def decode_value(field, value):
+        if isinstance(field, DateTimeField):
+            parsed = parse_datetime(value)
+            if parsed is None:
+                raise ValueError
+            return parsed
+        return field.to_python(value)
+
+    def encode_cursor(self, obj):
+        position = [
+            self.encode_value(getattr(obj, field.lstrip('-')))
+            for field in self.fields
+        ]
+        return urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(urlsafe_b64decode(encoded.encode()))
+            if len(position) != len(self.fields):
+                raise ValueError
+            return [
+                self.decode_value(
+                    model._meta.get_field(field.lstrip('-')),
+                    value
+                )
+                for field, value in zip(self.fields, position)
+            ]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def check_ordering(self, request):
+        """
+        Ошибка 400, если запрос просит порядок, отличный от порядка курсора.
+
+        Иначе курсор молча вернул бы рецепты в своём порядке вместо
+        запрошенной сортировки или ранжирования поиска.
+        """
+        ordering = [
+            field.strip()
+            for field in request.query_params.get(
+                self.ordering_query_param,
+                ''
+            ).split(',')
+            if field.strip()
+        ]
+        if ordering and ordering != list(self.fields[:len(ordering)]):
+            raise ValidationError({
+                self.ordering_query_param: self.invalid_ordering_message
+            })
+        for param in self.ranked_query_params:
+            if request.query_params.get(param):
+                raise ValidationError({param: self.invalid_ordering_message})
+
+    def get_keyset_filter(self, position):
+        """
+        Условие "строго после курсора" для полей сортировки.
+
+        Цепочка OR дополняется по AND нестрогой границей по первому полю,
+        чтобы индекс по полям сортировки начинал просмотр с курсора, а не
+        с начала индекса.
+        """
+        conditions = []
+        for index, field in enumerate(self.fields):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            equal = [
+                Q(**{previous.lstrip('-'): value})
+                for previous, value in zip(self.fields[:index], position)
+            ]
+            conditions.append(reduce(
+                and_,
+                equal,
+                Q(**{f'{name}__{lookup}': position[index]})
+            ))
+        first = self.fields[0]
+        bound = 'lte' if first.startswith('-') else 'gte'
+        return Q(**{f'{first.lstrip("-")}__{bound}': position[0]}) & reduce(
+            or_,
+            conditions
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.fields = self.get_ordering(view)
+        self.check_ordering(request)
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request, queryset.model)
+        queryset = queryset.order_by(*self.fields)
+        if position is not None:
+            queryset = queryset.filter(self.get_keyset_filter(position))
+        page = list(queryset[:page_size + 1])
+        self.has_next = len(page) > page_size
+        page = page[:page_size]
+        self.next_cursor = self.encode_cursor(page[-1]) if page else None
+        return page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.next_cursor
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
 
 
 class LimitPagination(PageNumberPagination):
+    """
+    Постраничная пагинация с переключением в режим курсора.
+
+    Если в запросе есть параметр cursor (в том числе пустой, для первой
+    страницы), страница выбирается KeysetPagination без подсчёта COUNT(*).
+    """
+
     page_size_query_param = 'limit'
+    cursor_pagination_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        cursor_query_param = self.cursor_pagination_class.cursor_query_param
+        if (cursor_query_param in request.query_params
+                and isinstance(queryset, QuerySet)):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset,
+                request,
+                view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,11 @@
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+from asgiref.wsgi import WsgiToAsgi
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+
+# Django 2.2 не умеет обрабатывать ASGI-запросы сам, поэтому
+# WSGI-приложение выполняется в пуле потоков адаптера asgiref.
+application = WsgiToAsgi(get_wsgi_application())
@@ -0,0 +1,40 @@
+import time
+
+from django.conf import settings
+from django.db import connections
+
+IDLE_CHECK = getattr(settings, 'CONN_HEALTH_CHECK_IDLE', 30)
+
+
+class ConnectionHealthMiddleware:
+    """
+    Проверка постоянных соединений с БД перед повторным использованием.
+
+    При CONN_MAX_AGE > 0 соединение переживает запрос, и перезапуск
+    PostgreSQL или обрыв по таймауту обнаружатся только ошибкой в
+    следующем запросе. Соединение, простоявшее дольше
+    CONN_HEALTH_CHECK_IDLE секунд, перед запросом проверяется через
+    is_usable() и закрывается, если им нельзя пользоваться: Django
+    откроет новое при первом обращении.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        now = time.monotonic()
+        for connection in connections.all():
+            if connection.connection is None or connection.in_atomic_block:
+                continue
+            used_at = getattr(connection, 'used_at', None)
+            if used_at is not None and now - used_at < IDLE_CHECK:
+                continue
+            if not connection.is_usable():
+                connection.close()
+        try:
+            return self.get_response(request)
+        finally:
+            now = time.monotonic()
+            for connection in connections.all():
+                if connection.connection is not None:
+                    connection.used_at = now
@@ -0,0 +1,148 @@
+import hashlib
+import logging
+import random
+import time
+from threading import Lock, local
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+REPLICAS = getattr(settings, 'DATABASE_REPLICAS', ())
+STICKY_SECONDS = getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+MAX_LAG = getattr(settings, 'REPLICA_MAX_LAG', 5)
+CHECK_INTERVAL = getattr(settings, 'REPLICA_CHECK_INTERVAL', 10)
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Если реплика применила всё полученное, она не отстаёт, даже когда
+# последняя транзакция на основной БД была давно. На основной БД обе
+# функции возвращают NULL.
+LAG_SQL = """
+    SELECT COALESCE(CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END, 0)
+"""
+
+_state = local()
+
+
+class ReplicaPool:
+    """
+    Реплики, из которых можно читать.
+
+    Раз в REPLICA_CHECK_INTERVAL секунд первый пришедший запрос проверяет
+    реплики: недоступные и отстающие больше чем на REPLICA_MAX_LAG секунд
+    исключаются из ротации до следующей проверки.
+    """
+
+    def __init__(self, aliases):
+        self.aliases = tuple(aliases)
+        self._healthy = self.aliases
+        self._checked_at = None
+        self._lock = Lock()
+
+    @staticmethod
+    def get_lag(alias):
+        connection = connections[alias]
+        with connection.cursor() as cursor:
+            if connection.vendor != 'postgresql':
+                cursor.execute('SELECT 1')
+                return 0.0
+            cursor.execute(LAG_SQL)
+            return float(cursor.fetchone()[0])
+
+    def check(self):
+        healthy = []
+        for alias in self.aliases:
+            try:
+                lag = self.get_lag(alias)
+            except DatabaseError:
+                logger.warning('Replica %s is unavailable', alias)
+                continue
+            if lag > MAX_LAG:
+                logger.warning('Replica %s lags by %.1fs', alias, lag)
+                continue
+            healthy.append(alias)
+        self._healthy = tuple(healthy)
+        self._checked_at = time.monotonic()
+
+    def choose(self):
+        if (self._checked_at is None
+                or time.monotonic() - self._checked_at >= CHECK_INTERVAL):
+            if self._lock.acquire(blocking=False):
+                try:
+                    self.check()
+                finally:
+                    self._lock.release()
+        healthy = self._healthy
+        return random.choice(healthy) if healthy else None
+
+
+replica_pool = ReplicaPool(REPLICAS)
+
+
+class ReplicaRouter:
+    """
+    Чтение с реплики, выбранной ReplicaMiddleware, запись в default.
+
+    Вне запросов, например в командах manage.py, реплика не выбрана и все
+    запросы идут в default. После первой записи в запросе чтение до конца
+    запроса тоже идёт в default, чтобы видеть свои изменения.
+    """
+
+    def db_for_read(self, model, **hints):
+        return getattr(_state, 'replica', None)
+
+    def db_for_write(self, model, **hints):
+        _state.replica = None
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == 'default'
+
+
+def get_sticky_keys(request):
+    """Ключи клиента: по токену из заголовка и по адресу."""
+    address = request.META.get(
+        'HTTP_X_REAL_IP',
+        request.META.get('REMOTE_ADDR', '')
+    )
+    keys = [f'replica:sticky:address:{address}']
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if authorization:
+        digest = hashlib.sha1(authorization.encode()).hexdigest()
+        keys.append(f'replica:sticky:token:{digest}')
+    return keys
+
+
+class ReplicaMiddleware:
+    """
+    Направляет чтение безопасных запросов на реплику.
+
+    После изменяющего запроса клиент REPLICA_STICKY_SECONDS секунд читает
+    из основной БД, пока реплики не догонят его изменения. Клиент
+    узнаётся и по токену, и по адресу: сразу после входа токена в
+    запросах ещё нет.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replica_pool.aliases:
+            return self.get_response(request)
+        keys = get_sticky_keys(request)
+        if request.method in SAFE_METHODS and not cache.get_many(keys):
+            _state.replica = replica_pool.choose()
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.replica = None
+        if request.method not in SAFE_METHODS:
+            cache.set_many(dict.fromkeys(keys, True), STICKY_SECONDS)
+        return response
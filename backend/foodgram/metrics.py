@@ -0,0 +1,197 @@
+import logging
+import random
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+from threading import Lock
+
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = getattr(settings, 'METRICS_SAMPLE_RATE', 1.0)
+QUERY_THRESHOLD = getattr(settings, 'METRICS_QUERY_THRESHOLD', 20)
+ALLOWED_IPS = frozenset(getattr(settings, 'METRICS_ALLOWED_IPS', ()))
+METRICS = (
+    ('requests', 'counter', 'Sampled requests.'),
+    ('queries', 'counter', 'SQL queries executed.'),
+    ('sql_seconds', 'counter', 'Time spent in SQL.'),
+    ('serialize_seconds', 'counter',
+     'Time spent in the view outside SQL, mostly serialization.'),
+    ('duration_seconds', 'counter', 'Total time spent in the view.'),
+    ('response_bytes', 'counter', 'Response body size.'),
+)
+
+
+class QueryCollector:
+    """Обёртка execute_wrapper, считающая запросы и время их выполнения."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+            self.statements[sql] += 1
+
+
+class MetricsRegistry:
+    """
+    Накопленные метрики по представлениям в пределах процесса.
+
+    Каждый воркер gunicorn хранит собственные значения, поэтому Prometheus
+    должен собирать их с каждого воркера или суммировать по instance.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._views = defaultdict(lambda: dict.fromkeys(
+            (name for name, _, _ in METRICS), 0
+        ))
+        self._counters = {}
+
+    def describe_counter(self, name, label, description):
+        """Счётчик вне представлений с одной меткой, например кэша."""
+        self._counters.setdefault(name, (label, description, Counter()))
+
+    def increment(self, name, value):
+        with self._lock:
+            self._counters[name][2][value] += 1
+
+    def record(self, view, **values):
+        with self._lock:
+            totals = self._views[view]
+            totals['requests'] += 1
+            for name, value in values.items():
+                totals[name] += value
+
+    def render(self):
+        with self._lock:
+            views = {
+                view: dict(totals) for view, totals in self._views.items()
+            }
+            counters = {
+                name: (label, description, dict(counts))
+                for name, (label, description, counts)
+                in self._counters.items()
+            }
+        lines = []
+        for name, kind, description in METRICS:
+            metric = f'foodgram_view_{name}_total'
+            lines.append(f'# HELP {metric} {description}')
+            lines.append(f'# TYPE {metric} {kind}')
+            for view, totals in sorted(views.items()):
+                lines.append(f'{metric}{{view="{view}"}} {totals[name]}')
+        for name, (label, description, counts) in sorted(counters.items()):
+            metric = f'foodgram_{name}_total'
+            lines.append(f'# HELP {metric} {description}')
+            lines.append(f'# TYPE {metric} counter')
+            for value, count in sorted(counts.items()):
+                lines.append(f'{metric}{{{label}="{value}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def get_view_name(view_func, method):
+    """Имя представления вида RecipeViewSet.list для viewset-ов DRF."""
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return f'{view_func.__module__}.{view_func.__qualname__}'
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(method.lower(), method.lower())
+    return f'{cls.__name__}.{action}'
+
+
+class MetricsMiddleware:
+    """
+    Число запросов к БД, время SQL, время вне SQL и размер ответа для
+    каждого представления.
+
+    Метрики собираются для доли запросов METRICS_SAMPLE_RATE, отдаются в
+    заголовке Server-Timing и накапливаются для metrics_view. Запросы,
+    выполнившие больше METRICS_QUERY_THRESHOLD обращений к БД, пишутся
+    в лог вместе с самым повторяющимся SQL, чтобы находить N+1.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= SAMPLE_RATE:
+            return self.get_response(request)
+        collector = QueryCollector()
+        request.metrics_view = None
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(
+                    connections[alias].execute_wrapper(collector)
+                )
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+        if request.metrics_view is None:
+            return response
+        self.record(request, response, collector, duration)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_view = get_view_name(view_func, request.method)
+
+    def record(self, request, response, collector, duration):
+        serialize = max(duration - collector.seconds, 0.0)
+        if response.streaming:
+            size = int(response.get('Content-Length', 0))
+        else:
+            size = len(response.content)
+        registry.record(
+            request.metrics_view,
+            queries=collector.count,
+            sql_seconds=collector.seconds,
+            serialize_seconds=serialize,
+            duration_seconds=duration,
+            response_bytes=size,
+        )
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={collector.seconds * 1000:.1f};'
+            f'desc="{collector.count} queries"',
+            f'serialize;dur={serialize * 1000:.1f}',
+            f'total;dur={duration * 1000:.1f}',
+        ))
+        if collector.count > QUERY_THRESHOLD:
+            sql, repeats = collector.statements.most_common(1)[0]
+            logger.warning(
+                '%s %s ran %d queries, repeated %d times: %s',
+                request.method,
+                request.metrics_view,
+                collector.count,
+                repeats,
+                sql,
+            )
+
+
+def metrics_view(request):
+    """
+    Метрики процесса в текстовом формате Prometheus.
+
+    Метрики раскрывают задержки и число запросов по представлениям,
+    поэтому отдаются только адресам из METRICS_ALLOWED_IPS и сотрудникам,
+    вошедшим в админку. Остальным эндпоинт отвечает 404.
+    """
+    user = getattr(request, 'user', None)
+    if (request.META.get('REMOTE_ADDR') not in ALLOWED_IPS
+            and not (user is not None and user.is_staff)):
+        raise Http404
+    return HttpResponse(
+        registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -9,7 +9,9 @@ SECRET_KEY = os.getenv('MY_SECRET_KEY', default='SAME_KEY')
 
 DEBUG = os.getenv('DEBUG_POSITION', default=False)
 
-ALLOWED_HOSTS = ['*']
+ALLOWED_HOSTS = os.getenv(
+    'ALLOWED_HOSTS', default='localhost,127.0.0.1'
+).split(',')
 
 INSTALLED_APPS = [
     'django.contrib.admin',
@@ -32,6 +34,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram.connections.ConnectionHealthMiddleware',
+    'foodgram.metrics.MetricsMiddleware',
+    'foodgram.db_router.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -63,12 +68,56 @@ WSGI_APPLICATION = 'foodgram.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': os.environ.get(
+            'DB_ENGINE',
+            'django.db.backends.postgresql'
+        ),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('POSTGRES_USER'),
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD'),
         'HOST': os.environ.get('DB_HOST'),
         'PORT': os.environ.get('DB_PORT'),
+        'CONN_MAX_AGE': int(os.getenv('CONN_MAX_AGE', default=60)),
+    }
+}
+CONN_HEALTH_CHECK_IDLE = int(os.getenv('CONN_HEALTH_CHECK_IDLE', default=30))
+
+# Реплики для чтения: DB_REPLICAS=host1:5432,host2 для PostgreSQL или
+# пути к файлам для SQLite. Остальные параметры берутся из default.
+DATABASE_REPLICAS = []
+for number, replica in enumerate(
+        filter(None, os.getenv('DB_REPLICAS', default='').split(',')), 1
+):
+    if 'sqlite' in DATABASES['default']['ENGINE']:
+        replica_options = {'NAME': replica}
+    else:
+        host, _, port = replica.partition(':')
+        replica_options = {
+            'HOST': host,
+            'PORT': port or DATABASES['default']['PORT'],
+            'OPTIONS': {'connect_timeout': 2},
+        }
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        **replica_options,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+DATABASE_ROUTERS = ['foodgram.db_router.ReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', default=10))
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', default=5))
+REPLICA_CHECK_INTERVAL = int(os.getenv('REPLICA_CHECK_INTERVAL', default=10))
+
+# Версии кэшей должны быть общими для всех воркеров gunicorn: при
+# нескольких воркерах укажите общий бэкенд, например
+# django.core.cache.backends.db.DatabaseCache.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=''),
     }
 }
 
@@ -107,7 +156,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_PAGINATION_CLASS':
         'api.pagination.LimitPagination',
@@ -124,12 +173,34 @@ DJOSER = {
     'HIDE_USERS': False,
     'PERMISSIONS': {
         'user': ['recipes.permissions.OwnerOrReadOnly'],
-        'user_list': ['rest_framework.permissions.OwnerOrReadOnly'],
+        'user_list': ['recipes.permissions.OwnerOrReadOnly'],
     },
 }
 
 
+METRICS_SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', default=1.0))
+METRICS_QUERY_THRESHOLD = int(os.getenv('METRICS_QUERY_THRESHOLD', default=20))
+METRICS_ALLOWED_IPS = [
+    ip for ip in os.getenv('METRICS_ALLOWED_IPS', default='').split(',') if ip
+]
+
+RECIPE_RESPONSE_CACHE_TIMEOUT = int(
+    os.getenv('RECIPE_RESPONSE_CACHE_TIMEOUT', default=60 * 10)
+)
+IMAGE_PROCESSING_WORKERS = int(os.getenv('IMAGE_PROCESSING_WORKERS', default=2))
+TRENDING_HALF_LIFE_HOURS = int(os.getenv('TRENDING_HALF_LIFE_HOURS', default=72))
+FOLLOW_GRAPH_CACHE_TIMEOUT = int(
+    os.getenv('FOLLOW_GRAPH_CACHE_TIMEOUT', default=60 * 60)
+)
+TOKEN_CACHE_TIMEOUT = int(os.getenv('TOKEN_CACHE_TIMEOUT', default=60 * 5))
+TOKEN_CACHE_LOCAL_TIMEOUT = int(
+    os.getenv('TOKEN_CACHE_LOCAL_TIMEOUT', default=5)
+)
+
+
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+DEFAULT_FILE_STORAGE = 'foodgram.storage.ContentAddressedStorage'
+ORPHAN_FILES_GRACE_PERIOD = 60 * 60
@@ -0,0 +1,67 @@
+import hashlib
+import os
+import posixpath
+from uuid import uuid4
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище, в котором имя файла - SHA-256 его содержимого.
+
+    Файл сохраняется в каталог из исходного имени с подкаталогом по первым
+    символам хэша, расширение исходного имени сохраняется. Повторная
+    загрузка того же содержимого не создаёт копию, а возвращает имя уже
+    записанного файла и обновляет время его изменения, чтобы сборщик
+    сирот не удалил файл, на который вот-вот сошлётся новая запись.
+    Содержимое файла по имени никогда не меняется, поэтому его можно
+    отдавать с заголовками immutable.
+    """
+
+    def get_content_name(self, name, content):
+        sha256 = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            sha256.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        digest = sha256.hexdigest()
+        directory, filename = posixpath.split(name)
+        extension = posixpath.splitext(filename)[1].lower()
+        return posixpath.join(directory, digest[:2], digest + extension)
+
+    def get_available_name(self, name, max_length=None):
+        """Имя по содержимому не меняется, даже если файл уже есть."""
+        return name
+
+    def _save(self, name, content):
+        """
+        Запись под временным именем и атомарное переименование.
+
+        Параллельная загрузка того же содержимого заменяет файл таким же,
+        поэтому имя всегда остаётся хэшем, без суффиксов.
+        """
+        temporary = super()._save(
+            posixpath.join(posixpath.dirname(name), f'.{uuid4().hex}.tmp'),
+            content
+        )
+        try:
+            os.replace(self.path(temporary), self.path(name))
+        except OSError:
+            self.delete(temporary)
+            raise
+        return name
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.get_content_name(name, content)
+        if self.exists(name):
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length=max_length)
@@ -0,0 +1,11 @@
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0:8000')
+# Кэши и версии данных по умолчанию хранятся в памяти процесса, поэтому
+# воркер один, а параллельность дают потоки. Каждый поток держит своё
+# постоянное соединение с БД (CONN_MAX_AGE), их число равно threads.
+workers = int(os.getenv('GUNICORN_WORKERS', 1))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+keepalive = 5
+timeout = 60
@@ -81,6 +81,7 @@ class AdminRecipe(admin.ModelAdmin):
         'name',
         'image',
         'added_recipes_count',
+        'in_carts_count',
     )
     inlines = (IngredientRecipeInline,)
     search_fields = (
@@ -96,11 +97,12 @@ class AdminRecipe(admin.ModelAdmin):
     empty_value_display = EMPTY_VALUE
 
     def added_recipes_count(self, obj):
-        return obj.favorite.count()
+        return obj.favorites_count
 
     added_recipes_count.short_description = (
         'Count of users, who added recipe in favorited.'
     )
+    added_recipes_count.admin_order_field = 'favorites_count'
 
 
 admin.site.register(Favorite)
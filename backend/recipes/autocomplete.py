@@ -0,0 +1,60 @@
+from bisect import bisect_left
+from threading import Lock
+
+from django.conf import settings
+
+from .reference import ingredient_reference
+
+AUTOCOMPLETE_LIMIT = getattr(settings, 'INGREDIENT_AUTOCOMPLETE_LIMIT', 50)
+
+
+class IngredientIndex:
+    """
+    Префиксный индекс ингредиентов в памяти процесса.
+
+    Индекс строится лениво по срезу справочника ingredient_reference и
+    хранит отсортированные по приведённому к нижнему регистру названию
+    записи, поэтому поиск по префиксу сводится к двоичному поиску. Индекс
+    перестраивается, как только справочник отдаёт новый срез.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        # Срез справочника, ключи и записи публикуются одним кортежем,
+        # чтобы поиск не увидел новые ключи со старыми записями.
+        self._index = (None, (), ())
+
+    @staticmethod
+    def build(snapshot):
+        rows = sorted(
+            snapshot.rows,
+            key=lambda row: (row['name'].casefold(), row['id'])
+        )
+        return (
+            snapshot,
+            tuple(row['name'].casefold() for row in rows),
+            tuple(rows),
+        )
+
+    def get_index(self):
+        snapshot = ingredient_reference.get_snapshot()
+        if self._index[0] is not snapshot:
+            with self._lock:
+                if self._index[0] is not snapshot:
+                    self._index = self.build(snapshot)
+        return self._index
+
+    def search(self, prefix, limit=AUTOCOMPLETE_LIMIT):
+        """Ингредиенты, название которых начинается с prefix."""
+        _, keys, items = self.get_index()
+        prefix = prefix.casefold()
+        result = []
+        position = bisect_left(keys, prefix)
+        while (position < len(keys) and len(result) < limit
+               and keys[position].startswith(prefix)):
+            result.append(items[position])
+            position += 1
+        return result
+
+
+ingredient_index = IngredientIndex()
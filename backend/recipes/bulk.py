@@ -0,0 +1,124 @@
+from django.db import router, transaction
+from django.db.models.sql import DeleteQuery
+
+from users.models import User, update_counter
+from .models import Recipe, RecipeIngredient, ShoppingCart
+from .response_cache import invalidate_popularity
+from .scores import mark_stale
+from .shopping_list import schedule_refresh
+from .signals import COUNTER_FIELDS
+
+
+class Outcome:
+    ADDED = 'added'
+    EXISTS = 'exists'
+    REMOVED = 'removed'
+    MISSING = 'missing'
+    NOT_FOUND = 'not_found'
+
+
+def after_bulk_change(model, user, recipe_ids, delta):
+    """
+    То, что для одиночных изменений делают сигналы.
+
+    bulk_create и удаление запросом сигналов не посылают, поэтому
+    счётчики, кэш ответов, оценки и список покупок обновляются здесь,
+    одним запросом на все рецепты.
+    """
+    if not recipe_ids:
+        return
+    update_counter(
+        Recipe.objects.filter(pk__in=recipe_ids),
+        COUNTER_FIELDS[model],
+        delta
+    )
+    invalidate_popularity()
+    mark_stale(recipe_ids)
+    if model is ShoppingCart:
+        schedule_refresh([user.pk], RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('ingredient_id', flat=True).distinct())
+
+
+def lock_user(user):
+    """
+    Блокирует строку пользователя до конца транзакции.
+
+    Изменения избранного и корзины одного пользователя выполняются по
+    очереди, поэтому строки, прочитанные после блокировки, не меняются
+    параллельными запросами до записи.
+    """
+    list(User.objects.select_for_update().filter(
+        pk=user.pk
+    ).values_list('pk', flat=True))
+
+
+def get_present(model, user, recipe_ids):
+    """Найденные рецепты и те из них, что уже есть у пользователя."""
+    found = set(Recipe.objects.filter(
+        pk__in=recipe_ids
+    ).values_list('pk', flat=True))
+    present = dict(model.objects.filter(
+        user=user,
+        recipe_id__in=found
+    ).values_list('recipe_id', 'pk'))
+    return found, present
+
+
+@transaction.atomic
+def add_recipes(model, user, recipe_ids):
+    """
+    Добавляет рецепты в избранное или корзину пользователя.
+
+    Возвращает исход для каждого id в порядке запроса. Строка
+    пользователя блокируется, поэтому добавленными считаются ровно те
+    найденные рецепты, которых не было у пользователя после блокировки,
+    и счётчики растут только на них.
+    """
+    lock_user(user)
+    found, present = get_present(model, user, recipe_ids)
+    added = [
+        recipe_id for recipe_id in recipe_ids
+        if recipe_id in found and recipe_id not in present
+    ]
+    model.objects.bulk_create([
+        model(user=user, recipe_id=recipe_id) for recipe_id in added
+    ])
+    after_bulk_change(model, user, added, 1)
+    return [
+        {'id': recipe_id, 'status': (
+            Outcome.NOT_FOUND if recipe_id not in found
+            else Outcome.EXISTS if recipe_id in present
+            else Outcome.ADDED
+        )}
+        for recipe_id in recipe_ids
+    ]
+
+
+@transaction.atomic
+def remove_recipes(model, user, recipe_ids):
+    """
+    Удаляет рецепты из избранного или корзины пользователя.
+
+    Строка пользователя блокируется, поэтому строка, удалённая
+    параллельным запросом, не уменьшит счётчик рецепта второй раз.
+    Строки удаляются одним DELETE по первичному ключу на БД из роутера.
+    QuerySet.delete() послал бы сигналы для каждой строки и повторил
+    работу after_bulk_change по запросу на строку.
+    """
+    lock_user(user)
+    found, present = get_present(model, user, recipe_ids)
+    if present:
+        DeleteQuery(model).delete_batch(
+            list(present.values()),
+            router.db_for_write(model)
+        )
+    after_bulk_change(model, user, list(present), -1)
+    return [
+        {'id': recipe_id, 'status': (
+            Outcome.NOT_FOUND if recipe_id not in found
+            else Outcome.REMOVED if recipe_id in present
+            else Outcome.MISSING
+        )}
+        for recipe_id in recipe_ids
+    ]
@@ -1,8 +1,11 @@
 from django.contrib.auth import get_user_model
+from django.db.models import F
 
 from django_filters import rest_framework as filters
+from rest_framework.filters import OrderingFilter
 
 from .models import Ingredient, Recipe, Tag
+from .search import search_recipes
 
 User = get_user_model()
 
@@ -19,6 +22,9 @@ class RecipeFilter(filters.FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
+    search = filters.CharFilter(
+        method='filter_search'
+    )
 
     class Meta:
         model = Recipe
@@ -38,6 +44,32 @@ class RecipeFilter(filters.FilterSet):
             return queryset.filter(shopping_cart__user=self.request.user)
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+
+class RecipeOrderingFilter(OrderingFilter):
+    """
+    OrderingFilter с сортировками popular и trending по RecipeScore.
+
+    Рецепты сортируются по таблице оценок без агрегации избранного и
+    корзин. Рецепты, для которых оценка ещё не посчитана, не
+    отбрасываются, а идут в конце списка.
+    """
+
+    score_orderings = {
+        'popular': (F('score__popularity').desc(nulls_last=True), '-pk'),
+        'trending': (F('score__trending').desc(nulls_last=True), '-pk'),
+    }
+
+    def filter_queryset(self, request, queryset, view):
+        ordering = self.score_orderings.get(
+            request.query_params.get(self.ordering_param)
+        )
+        if ordering is None:
+            return super().filter_queryset(request, queryset, view)
+        return queryset.order_by(*ordering)
+
 
 class IngredientFilter(filters.FilterSet):
     name = filters.CharFilter(lookup_expr='istartswith')
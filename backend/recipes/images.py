@@ -0,0 +1,205 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from itertools import islice
+from threading import Lock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+
+from PIL import Image, ImageOps, features
+
+from .models import Recipe
+from .response_cache import invalidate_recipes
+
+logger = logging.getLogger(__name__)
+
+WORKERS = getattr(settings, 'IMAGE_PROCESSING_WORKERS', 2)
+RENDITIONS = getattr(settings, 'RECIPE_IMAGE_RENDITIONS', (
+    ('image_thumbnail', (160, 160)),
+    ('image_card', (480, 480)),
+    ('image_full', (1280, 1280)),
+))
+RENDITION_FIELDS = tuple(field for field, _ in RENDITIONS)
+FILE_FIELDS = ('image',) + RENDITION_FIELDS
+GRACE_PERIOD = getattr(settings, 'ORPHAN_FILES_GRACE_PERIOD', 60 * 60)
+QUALITY = 82
+ORPHANS_BATCH_SIZE = 500
+
+if features.check('webp'):
+    IMAGE_FORMAT, IMAGE_EXTENSION = 'WEBP', 'webp'
+else:
+    IMAGE_FORMAT, IMAGE_EXTENSION = 'JPEG', 'jpg'
+
+
+def load_image(file):
+    """
+    Картинка с применённым поворотом из EXIF и без метаданных.
+
+    Pillow не переносит EXIF и ICC-профиль при сохранении, если их не
+    передать явно, поэтому достаточно очистить info у исходной картинки.
+    """
+    with Image.open(file) as image:
+        image = ImageOps.exif_transpose(image)
+        has_alpha = (
+            'A' in image.getbands() or 'transparency' in image.info
+        )
+        if has_alpha and IMAGE_FORMAT == 'WEBP':
+            image = image.convert('RGBA')
+        else:
+            image = image.convert('RGB')
+    image.info = {}
+    return image
+
+
+def render(image, size):
+    rendition = image.copy()
+    rendition.thumbnail(size, Image.Resampling.LANCZOS)
+    buffer = BytesIO()
+    rendition.save(buffer, IMAGE_FORMAT, quality=QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def save_rendition(content):
+    return default_storage.save(
+        f'recipes/renditions/rendition.{IMAGE_EXTENSION}',
+        ContentFile(content)
+    )
+
+
+def get_file_names(recipe):
+    return {
+        getattr(recipe, field).name
+        for field in FILE_FIELDS
+        if getattr(recipe, field)
+    }
+
+
+def get_referenced(names):
+    """
+    Имена из names, на которые ссылается хотя бы один рецепт.
+
+    По одному запросу на поле с файлом, каждый идёт по индексу поля.
+    """
+    referenced = set()
+    for field in FILE_FIELDS:
+        referenced.update(Recipe.objects.filter(
+            **{f'{field}__in': names}
+        ).order_by().values_list(field, flat=True))
+    return referenced
+
+
+def delete_orphans(names, grace_period=GRACE_PERIOD):
+    """
+    Удаляет файлы из names, на которые не ссылается ни один рецепт.
+
+    Одинаковые картинки разных рецептов хранятся одним файлом, поэтому
+    число ссылок считается по всем полям с файлами. Файлы, записанные или
+    загруженные повторно меньше grace_period секунд назад, не удаляются:
+    ссылающийся на них рецепт может быть ещё не зафиксирован. Такие файлы
+    удаляет команда collect_media.
+    """
+    deleted = 0
+    threshold = time.time() - grace_period
+    names = iter(names)
+    batch = list(islice(names, ORPHANS_BATCH_SIZE))
+    while batch:
+        referenced = get_referenced(batch)
+        for name in batch:
+            if name in referenced or not default_storage.exists(name):
+                continue
+            modified = default_storage.get_modified_time(name).timestamp()
+            if modified > threshold:
+                continue
+            default_storage.delete(name)
+            deleted += 1
+        batch = list(islice(names, ORPHANS_BATCH_SIZE))
+    return deleted
+
+
+def release_files_on_commit(names):
+    """Проверка освободившихся файлов после фиксации транзакции."""
+    if names:
+        transaction.on_commit(lambda: delete_orphans(names))
+
+
+def process_recipe_image(recipe_id):
+    """
+    Создаёт уменьшенные копии картинки рецепта и сохраняет их в рецепт.
+
+    Копии записываются, только если картинка рецепта не сменилась за
+    время обработки, иначе их перезапишет обработка новой картинки.
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).only(*FILE_FIELDS).first()
+    if recipe is None or not recipe.image:
+        return
+    with recipe.image.open('rb') as file:
+        image = load_image(file)
+    renditions = {
+        field: save_rendition(render(image, size))
+        for field, size in RENDITIONS
+    }
+    if Recipe.objects.filter(
+            pk=recipe_id,
+            image=recipe.image.name
+    ).update(**renditions):
+        invalidate_recipes([recipe_id])
+        release_files_on_commit(
+            get_file_names(recipe) - set(renditions.values())
+            - {recipe.image.name}
+        )
+
+
+class ImagePipeline:
+    """
+    Очередь обработки картинок в пуле потоков процесса.
+
+    Задачи не переживают перезапуск воркера: рецепты без копий картинки
+    обрабатывает команда process_images. При IMAGE_PROCESSING_WORKERS = 0
+    картинка обрабатывается сразу после фиксации транзакции в том же
+    потоке.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._lock = Lock()
+        self._executor = None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers,
+                        thread_name_prefix='recipe-images'
+                    )
+        return self._executor
+
+    @staticmethod
+    def run(recipe_id):
+        try:
+            process_recipe_image(recipe_id)
+        except Exception:
+            logger.exception('Failed to process image of recipe %s', recipe_id)
+
+    def run_in_worker(self, recipe_id):
+        try:
+            self.run(recipe_id)
+        finally:
+            connection.close()
+
+    def submit(self, recipe_id):
+        if not self.workers:
+            self.run(recipe_id)
+            return
+        self.executor.submit(self.run_in_worker, recipe_id)
+
+    def submit_on_commit(self, recipe_id):
+        transaction.on_commit(lambda: self.submit(recipe_id))
+
+
+image_pipeline = ImagePipeline(WORKERS)
@@ -0,0 +1,36 @@
+import posixpath
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from recipes.images import delete_orphans
+
+
+def walk(directory):
+    directories, files = default_storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for name in directories:
+        yield from walk(posixpath.join(directory, name))
+
+
+class Command(BaseCommand):
+    help = "Удаление файлов рецептов, на которые не ссылается ни один рецепт"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--directory',
+            default='recipes',
+            help='Media directory to scan'
+        )
+
+    def handle(self, directory, **kwargs):
+        if not default_storage.exists(directory):
+            self.stdout.write(self.style.WARNING(
+                f'Directory {directory} does not exist'
+            ))
+            return
+        deleted = delete_orphans(walk(directory))
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} orphaned files'
+        ))
@@ -1,25 +1,162 @@
 import csv
+import json
+import time
+from itertools import islice
 from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
 from foodgram.settings import BASE_DIR
 from recipes.models import Ingredient
+from recipes.reference import ingredient_reference
 
 PROJECT_DIR = Path(BASE_DIR).resolve().joinpath('data')
 FILE_TO_OPEN = PROJECT_DIR / "ingredients.csv"
+BATCH_SIZE = 1000
+READ_SIZE = 64 * 1024
+DRY_RUN_SAMPLE = 10
+
+
+def read_csv(file):
+    for row in csv.reader(file, delimiter=","):
+        if len(row) >= 2:
+            yield row[0], row[1]
+
+
+def read_json(file):
+    """Потоковое чтение JSON-массива объектов без загрузки файла целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    while True:
+        chunk = file.read(READ_SIZE)
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started and buffer[position:position + 1] == '[':
+                started = True
+                position += 1
+                continue
+            if buffer[position:position + 1] in ('', ']'):
+                break
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if not chunk:
+                    raise
+                break
+            yield item['name'], item['measurement_unit']
+        buffer = buffer[position:]
+        if not chunk:
+            return
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
 
 
 class Command(BaseCommand):
-    help = "Импорт ингредиентов в БД"
-
-    def handle(self, **kwargs):
-        with open(
-            FILE_TO_OPEN, "r", encoding="UTF-8"
-        ) as file:
-            reader = csv.reader(file, delimiter=",")
-            for row in reader:
-                Ingredient.objects.get_or_create(
-                    name=row[0],
-                    measurement_unit=row[1]
+    help = "Импорт ингредиентов в БД из CSV или JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=str(FILE_TO_OPEN),
+            help='Путь к файлу с ингредиентами',
+        )
+        parser.add_argument(
+            '--format',
+            dest='file_format',
+            choices=READERS,
+            help='Формат файла, по умолчанию определяется по расширению',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Показать отличия файла от БД, ничего не записывая',
+        )
+
+    def handle(self, path, file_format=None, batch_size=BATCH_SIZE,
+               dry_run=False, **kwargs):
+        self.verbosity = kwargs['verbosity']
+        path = Path(path)
+        file_format = file_format or path.suffix.lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(f'Unknown file format: {path.suffix}')
+        started = time.monotonic()
+        with open(path, "r", encoding="UTF-8") as file:
+            rows = self.unique_rows(READERS[file_format](file))
+            if dry_run:
+                self.diff(rows)
+            else:
+                self.load(rows, batch_size)
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(
+            f'Read {self.read_count} rows, {self.duplicate_count} duplicates '
+            f'in {elapsed:.2f}s ({self.read_count / elapsed:.0f} rows/sec)'
+        )
+
+    def unique_rows(self, rows):
+        self.read_count = 0
+        self.duplicate_count = 0
+        seen = set()
+        for name, measurement_unit in rows:
+            self.read_count += 1
+            key = (name.strip(), measurement_unit.strip())
+            if key in seen:
+                self.duplicate_count += 1
+                continue
+            seen.add(key)
+            yield key
+
+    def load(self, rows, batch_size):
+        before = Ingredient.objects.count()
+        with transaction.atomic():
+            for chunk in chunked(rows, batch_size):
+                Ingredient.objects.bulk_create(
+                    [
+                        Ingredient(name=name, measurement_unit=unit)
+                        for name, unit in chunk
+                    ],
+                    ignore_conflicts=True,
                 )
+                if self.verbosity > 1:
+                    self.stdout.write(f'{self.read_count} rows processed')
+        ingredient_reference.invalidate()
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {Ingredient.objects.count() - before} ingredients'
+        ))
+
+    def diff(self, rows):
+        existing = set(
+            Ingredient.objects.values_list('name', 'measurement_unit')
+        )
+        new = [row for row in rows if row not in existing]
+        for name, unit in new[:DRY_RUN_SAMPLE]:
+            self.stdout.write(f'+ {name}, {unit}')
+        if len(new) > DRY_RUN_SAMPLE:
+            self.stdout.write(f'... and {len(new) - DRY_RUN_SAMPLE} more')
+        self.stdout.write(self.style.WARNING(
+            f'Dry run: {len(new)} ingredients would be created, '
+            f'{len(existing)} already exist'
+        ))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import image_pipeline
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Создание уменьшенных копий картинок рецептов"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            dest='process_all',
+            help='Process every recipe, not only the ones without renditions'
+        )
+
+    def handle(self, process_all=False, **kwargs):
+        recipes = Recipe.objects.exclude(image='').exclude(image=None)
+        if not process_all:
+            recipes = recipes.filter(image_full='')
+        processed = 0
+        for recipe_id in recipes.values_list('pk', flat=True).iterator():
+            image_pipeline.run(recipe_id)
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed images of {processed} recipes'
+        ))
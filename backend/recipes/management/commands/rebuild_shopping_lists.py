@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+
+from recipes.models import RecipeIngredient, ShoppingListItem
+from recipes.shopping_list import all_lists_version
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = "Полный пересчёт списков покупок по корзинам пользователей"
+
+    def handle(self, **kwargs):
+        totals = RecipeIngredient.objects.filter(
+            recipe__shopping_cart__isnull=False
+        ).order_by().values(
+            'recipe__shopping_cart__user', 'ingredient'
+        ).annotate(total=Sum('amount')).values_list(
+            'recipe__shopping_cart__user', 'ingredient', 'total'
+        )
+        with transaction.atomic():
+            ShoppingListItem.objects.all().delete()
+            items = ShoppingListItem.objects.bulk_create(
+                (
+                    ShoppingListItem(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        total_amount=total
+                    )
+                    for user_id, ingredient_id, total in totals.iterator()
+                ),
+                batch_size=BATCH_SIZE
+            )
+            all_lists_version.bump_on_commit()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {len(items)} shopping list items'
+        ))
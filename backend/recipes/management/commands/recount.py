@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Follow, User
+
+BATCH_SIZE = 1000
+
+
+def count_of(queryset, field):
+    """Подзапрос с количеством строк queryset, ссылающихся на OuterRef."""
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(count=Count('pk')).values('count')
+    ), 0)
+
+
+COUNTERS = (
+    (Recipe, 'favorites_count', count_of(Favorite.objects, 'recipe')),
+    (Recipe, 'in_carts_count', count_of(ShoppingCart.objects, 'recipe')),
+    (User, 'recipes_count', count_of(Recipe.objects, 'author')),
+    (User, 'followers_count', count_of(Follow.objects, 'author')),
+)
+
+
+class Command(BaseCommand):
+    help = "Пересчёт денормализованных счётчиков рецептов и пользователей"
+
+    def handle(self, **kwargs):
+        for model, field, expression in COUNTERS:
+            with transaction.atomic():
+                drifted = model.objects.annotate(
+                    actual=expression
+                ).filter(~Q(**{field: F('actual')})).values_list(
+                    'pk', 'actual'
+                )
+                objects = [
+                    model(pk=pk, **{field: actual})
+                    for pk, actual in drifted
+                ]
+                model.objects.bulk_update(
+                    objects,
+                    (field,),
+                    batch_size=BATCH_SIZE
+                )
+            self.stdout.write(
+                f'{model.__name__}.{field}: repaired {len(objects)} rows'
+            )
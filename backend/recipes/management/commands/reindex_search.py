@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from recipes.search import is_search_supported, update_search_vector
+
+
+class Command(BaseCommand):
+    help = "Пересчёт полнотекстового индекса рецептов"
+
+    def handle(self, **kwargs):
+        if not is_search_supported():
+            self.stdout.write(self.style.WARNING(
+                'Full-text search requires PostgreSQL'
+            ))
+            return
+        update_search_vector(Recipe.objects.values('pk'))
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt'))
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import Recipe, RecipeScore
+from recipes.response_cache import invalidate_scores
+from recipes.scores import BATCH_SIZE, update_scores
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчёт оценок рецептов для сортировок popular и trending, "
+        "изменившихся с прошлого запуска. Запускается по расписанию"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Создать недостающие оценки и пересчитать все',
+        )
+
+    def handle(self, full=False, **kwargs):
+        if full:
+            RecipeScore.objects.bulk_create(
+                [
+                    RecipeScore(recipe_id=recipe_id)
+                    for recipe_id in Recipe.objects.filter(
+                        score__isnull=True
+                    ).values_list('pk', flat=True)
+                ],
+                batch_size=BATCH_SIZE,
+                ignore_conflicts=True
+            )
+            RecipeScore.objects.update(stale=True)
+        updated = 0
+        while True:
+            with transaction.atomic():
+                recipe_ids = list(RecipeScore.objects.filter(
+                    stale=True
+                ).values_list('pk', flat=True)[:BATCH_SIZE])
+                if not recipe_ids:
+                    break
+                # Отметка снимается до чтения событий: событие, случившееся
+                # во время пересчёта, пометит оценку снова.
+                RecipeScore.objects.filter(
+                    pk__in=recipe_ids
+                ).update(stale=False)
+                update_scores(recipe_ids)
+            updated += len(recipe_ids)
+        if updated:
+            invalidate_scores()
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated {updated} recipe scores'
+        ))
@@ -0,0 +1,331 @@
+import logging
+from array import array
+from collections import Counter, defaultdict
+from threading import Lock, Thread, local
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .models import Recipe, RecipeIngredient
+from .reference import CacheVersion
+
+logger = logging.getLogger(__name__)
+
+CHANGES_KEY = 'recipe_matching:changes:{version}'
+CHANGES_TIMEOUT = 60 * 60
+MAX_CHANGES = 100
+
+_pending = local()
+
+
+class MatchingData:
+    """
+    Неизменяемый срез индекса подбора рецептов.
+
+    Изменения создают новый срез, который заменяет текущий одним
+    присваиванием, поэтому потоки, читающие индекс, не видят его
+    частично обновлённым.
+    """
+
+    def __init__(self, version, postings, ingredients, cooking_times,
+                 recipe_tags, tag_recipes):
+        self.version = version
+        self.postings = postings
+        self.ingredients = ingredients
+        self.cooking_times = cooking_times
+        self.recipe_tags = recipe_tags
+        self.tag_recipes = tag_recipes
+
+
+def load_recipes(recipe_ids=None):
+    """
+    Ингредиенты, время приготовления и теги рецептов из БД.
+
+    Без recipe_ids загружаются все рецепты, иначе только перечисленные,
+    по индексам внешних ключей на recipe_id.
+    """
+    recipe_ingredients = RecipeIngredient.objects.values_list(
+        'recipe_id', 'ingredient_id'
+    )
+    recipe_tags = Recipe.tags.through.objects.values_list(
+        'recipe_id', 'tag_id'
+    )
+    recipes = Recipe.objects.values_list('id', 'cooking_time')
+    if recipe_ids is not None:
+        recipe_ingredients = recipe_ingredients.filter(
+            recipe_id__in=recipe_ids
+        )
+        recipe_tags = recipe_tags.filter(recipe_id__in=recipe_ids)
+        recipes = recipes.filter(id__in=recipe_ids)
+    ingredients = defaultdict(list)
+    for recipe_id, ingredient_id in recipe_ingredients.order_by().iterator():
+        ingredients[recipe_id].append(ingredient_id)
+    tags = defaultdict(set)
+    for recipe_id, tag_id in recipe_tags.iterator():
+        tags[recipe_id].add(tag_id)
+    cooking_times = dict(recipes.order_by().iterator())
+    return (
+        {
+            recipe_id: tuple(ingredients.get(recipe_id, ()))
+            for recipe_id in cooking_times
+        },
+        cooking_times,
+        {
+            recipe_id: frozenset(tags.get(recipe_id, ()))
+            for recipe_id in cooking_times
+        },
+    )
+
+
+class RecipeMatchingIndex:
+    """
+    Инвертированный индекс "ингредиент -> рецепты" в памяти процесса.
+
+    Для каждого ингредиента хранится отсортированный массив id рецептов,
+    поэтому подбор рецептов по набору ингредиентов не обращается к таблице
+    RecipeIngredient. Изменённые рецепты публикуются в кэше Django под
+    последовательными номерами версий, и воркер, заметивший новую версию,
+    перечитывает только эти рецепты. Если цепочка изменений потеряна,
+    индекс перестраивается целиком в фоновом потоке, а запросы до замены
+    обслуживает прежний срез.
+    """
+
+    def __init__(self):
+        self.version = CacheVersion('recipe_matching:version')
+        self._lock = Lock()
+        self._data = None
+        self._rebuilding = False
+
+    @staticmethod
+    def build(version):
+        ingredients, cooking_times, recipe_tags = load_recipes()
+        postings = defaultdict(list)
+        tag_recipes = defaultdict(set)
+        for recipe_id in sorted(ingredients):
+            for ingredient_id in ingredients[recipe_id]:
+                postings[ingredient_id].append(recipe_id)
+            for tag_id in recipe_tags[recipe_id]:
+                tag_recipes[tag_id].add(recipe_id)
+        return MatchingData(
+            version,
+            {
+                ingredient_id: array('q', recipe_ids)
+                for ingredient_id, recipe_ids in postings.items()
+            },
+            ingredients,
+            cooking_times,
+            recipe_tags,
+            {
+                tag_id: frozenset(recipe_ids)
+                for tag_id, recipe_ids in tag_recipes.items()
+            },
+        )
+
+    @staticmethod
+    def apply(data, version, recipe_ids):
+        """Новый срез, в котором рецепты recipe_ids перечитаны из БД."""
+        ingredients, cooking_times, recipe_tags = load_recipes(recipe_ids)
+        postings = dict(data.postings)
+        tag_recipes = dict(data.tag_recipes)
+        all_ingredients = dict(data.ingredients)
+        all_cooking_times = dict(data.cooking_times)
+        all_recipe_tags = dict(data.recipe_tags)
+        touched_ingredients = set()
+        touched_tags = set()
+        for recipe_id in recipe_ids:
+            touched_ingredients.update(data.ingredients.get(recipe_id, ()))
+            touched_ingredients.update(ingredients.get(recipe_id, ()))
+            touched_tags.update(data.recipe_tags.get(recipe_id, ()))
+            touched_tags.update(recipe_tags.get(recipe_id, ()))
+            if recipe_id in cooking_times:
+                all_ingredients[recipe_id] = ingredients[recipe_id]
+                all_cooking_times[recipe_id] = cooking_times[recipe_id]
+                all_recipe_tags[recipe_id] = recipe_tags[recipe_id]
+            else:
+                all_ingredients.pop(recipe_id, None)
+                all_cooking_times.pop(recipe_id, None)
+                all_recipe_tags.pop(recipe_id, None)
+        for ingredient_id in touched_ingredients:
+            posting = sorted(
+                {
+                    recipe_id
+                    for recipe_id in postings.get(ingredient_id, ())
+                    if recipe_id not in recipe_ids
+                } | {
+                    recipe_id for recipe_id in recipe_ids
+                    if ingredient_id in ingredients.get(recipe_id, ())
+                }
+            )
+            if posting:
+                postings[ingredient_id] = array('q', posting)
+            else:
+                postings.pop(ingredient_id, None)
+        for tag_id in touched_tags:
+            tag_recipes[tag_id] = frozenset(
+                recipe_id
+                for recipe_id in tag_recipes.get(tag_id, ())
+                if recipe_id not in recipe_ids
+            ) | frozenset(
+                recipe_id for recipe_id in recipe_ids
+                if tag_id in recipe_tags.get(recipe_id, ())
+            )
+        return MatchingData(
+            version,
+            postings,
+            all_ingredients,
+            all_cooking_times,
+            all_recipe_tags,
+            tag_recipes,
+        )
+
+    def get_changes(self, data, version):
+        """
+        Рецепты, изменённые между версией среза и version.
+
+        None, если цепочка изменений неполна и нужно полное перестроение.
+        """
+        if not 0 < version - data.version <= MAX_CHANGES:
+            return None
+        keys = [
+            CHANGES_KEY.format(version=number)
+            for number in range(data.version + 1, version + 1)
+        ]
+        changes = cache.get_many(keys)
+        if len(changes) != len(keys):
+            return None
+        return set().union(*changes.values())
+
+    def rebuild(self, version):
+        try:
+            data = self.build(version)
+            with self._lock:
+                if self._data is None or self._data.version < version:
+                    self._data = data
+        except Exception:
+            logger.exception('Failed to rebuild recipe matching index')
+        finally:
+            self._rebuilding = False
+            connection.close()
+
+    def rebuild_in_background(self, version):
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        Thread(
+            target=self.rebuild,
+            args=(version,),
+            name='recipe-matching-rebuild',
+            daemon=True
+        ).start()
+
+    def get_data(self):
+        """
+        Актуальный срез индекса.
+
+        Только первый запрос процесса строит индекс синхронно, дальше
+        запросы применяют короткие цепочки изменений или получают прежний
+        срез, пока фоновый поток строит новый.
+        """
+        version = self.version.get()
+        data = self._data
+        if data is None:
+            with self._lock:
+                if self._data is None:
+                    self._data = self.build(version)
+                return self._data
+        if data.version == version:
+            return data
+        recipe_ids = self.get_changes(data, version)
+        if recipe_ids is None:
+            self.rebuild_in_background(version)
+            return data
+        if not self._lock.acquire(blocking=False):
+            return data
+        try:
+            if self._data is data:
+                self._data = self.apply(data, version, recipe_ids)
+            return self._data
+        finally:
+            self._lock.release()
+
+    def match(self, ingredient_ids, min_match=1, tag_ids=None,
+              max_cooking_time=None):
+        """
+        Рецепты, содержащие не меньше min_match ингредиентов из
+        ingredient_ids, по убыванию доли имеющихся ингредиентов рецепта.
+
+        Возвращает список кортежей (recipe_id, совпало, всего ингредиентов).
+        """
+        data = self.get_data()
+        matches = Counter()
+        for ingredient_id in set(ingredient_ids):
+            matches.update(data.postings.get(ingredient_id, ()))
+        allowed = None
+        if tag_ids:
+            allowed = set().union(
+                *(data.tag_recipes.get(tag_id, ()) for tag_id in tag_ids)
+            )
+        result = []
+        for recipe_id, matched in matches.items():
+            if matched < min_match:
+                continue
+            if allowed is not None and recipe_id not in allowed:
+                continue
+            if (max_cooking_time is not None
+                    and data.cooking_times.get(recipe_id, 0)
+                    > max_cooking_time):
+                continue
+            result.append((
+                recipe_id,
+                matched,
+                len(data.ingredients[recipe_id])
+            ))
+        result.sort(key=lambda item: (
+            -item[1] / item[2],
+            -item[1],
+            -item[0],
+        ))
+        return result
+
+    def publish(self, recipe_ids):
+        """
+        Новая версия индекса со списком изменённых рецептов.
+
+        None в списке означает полное перестроение. Если ключ версии
+        вытеснен из кэша, версия начинается заново, и воркеры тоже
+        перестраивают индекс целиком.
+        """
+        try:
+            version = cache.incr(self.version.key)
+        except ValueError:
+            self.version.bump()
+            return
+        cache.set(
+            CHANGES_KEY.format(version=version),
+            recipe_ids,
+            CHANGES_TIMEOUT
+        )
+
+    def flush(self):
+        recipe_ids = getattr(_pending, 'recipe_ids', None) or set()
+        _pending.recipe_ids = set()
+        if recipe_ids:
+            self.publish(None if None in recipe_ids else recipe_ids)
+
+    def invalidate(self, recipe_ids=None):
+        """
+        Отложенная до фиксации транзакции публикация изменённых рецептов.
+
+        Без recipe_ids индекс перестраивается целиком.
+        """
+        if not hasattr(_pending, 'recipe_ids'):
+            _pending.recipe_ids = set()
+        if recipe_ids is None:
+            _pending.recipe_ids.add(None)
+        else:
+            _pending.recipe_ids.update(recipe_ids)
+        transaction.on_commit(self.flush)
+
+
+recipe_matching_index = RecipeMatchingIndex()
@@ -1,7 +1,31 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import BooleanField, Exists, OuterRef, Q, Value
+from django.utils import timezone
 
-from users.models import User
+from users.models import CounterFieldsMixin, User
+
+
+class PostgresGinIndex(GinIndex):
+    """
+    GIN-индекс, который создаётся только в PostgreSQL.
+
+    Индекс объявлен в модели на любой СУБД, поэтому состояние модели и
+    миграции не зависят от окружения, а на других СУБД создание и
+    удаление индекса пропускаются.
+    """
+
+    def create_sql(self, model, schema_editor, using=''):
+        if schema_editor.connection.vendor != 'postgresql':
+            return ''
+        return super().create_sql(model, schema_editor, using=using)
+
+    def remove_sql(self, model, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return ''
+        return super().remove_sql(model, schema_editor)
 
 
 class Tag(models.Model):
@@ -41,12 +65,41 @@ class Ingredient(models.Model):
         ordering = ('name',)
         verbose_name = 'Ingredient'
         verbose_name_plural = 'Ingredients'
+        constraints = [
+            models.UniqueConstraint(
+                fields=[
+                    'name',
+                    'measurement_unit',
+                ],
+                name='unique ingredient unit'
+            )
+        ]
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}'
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    def with_user_flags(self, user):
+        """Аннотирует рецепты флагами избранного и корзины для user."""
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField()),
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user,
+                recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user,
+                recipe=OuterRef('pk')
+            )),
+        )
+
+
+class Recipe(CounterFieldsMixin, models.Model):
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -62,8 +115,10 @@ class Recipe(models.Model):
     image = models.ImageField(
         verbose_name='recipe image',
         help_text='Recipe image',
+        upload_to='recipes/',
         blank=True,
         null=True,
+        db_index=True,
     )
     cooking_time = models.PositiveSmallIntegerField(
         help_text='Cooking time, min',
@@ -93,11 +148,64 @@ class Recipe(models.Model):
         verbose_name='Publication date',
         auto_now_add=True
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='favorites count',
+        default=0,
+        editable=False,
+        db_index=True,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='shopping carts count',
+        default=0,
+        editable=False,
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+    )
+    image_thumbnail = models.ImageField(
+        verbose_name='recipe image thumbnail',
+        upload_to='recipes/renditions/',
+        blank=True,
+        editable=False,
+        db_index=True,
+    )
+    image_card = models.ImageField(
+        verbose_name='recipe image for cards',
+        upload_to='recipes/renditions/',
+        blank=True,
+        editable=False,
+        db_index=True,
+    )
+    image_full = models.ImageField(
+        verbose_name='recipe image full size',
+        upload_to='recipes/renditions/',
+        blank=True,
+        editable=False,
+        db_index=True,
+    )
+
+    objects = RecipeQuerySet.as_manager()
+    counter_fields = ('favorites_count', 'in_carts_count')
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Recipe'
         verbose_name_plural = 'Recipes'
+        indexes = [
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='recipe_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx'
+            ),
+            PostgresGinIndex(
+                fields=['search_vector'],
+                name='recipe_search_vector_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.name} from {self.author}'
@@ -144,6 +252,11 @@ class Favorite(models.Model):
         related_name='favorite',
         verbose_name='recipe',
     )
+    created = models.DateTimeField(
+        verbose_name='added',
+        default=timezone.now,
+        editable=False,
+    )
 
     class Meta:
         ordering = ['-id']
@@ -176,6 +289,11 @@ class ShoppingCart(models.Model):
         related_name='shopping_cart',
         verbose_name='recipe',
     )
+    created = models.DateTimeField(
+        verbose_name='added',
+        default=timezone.now,
+        editable=False,
+    )
 
     class Meta:
         ordering = ['-id']
@@ -193,3 +311,96 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user} - {self.recipe}'
+
+
+class ShoppingListItem(models.Model):
+    """
+    Сумма ингредиента по всем рецептам в корзине пользователя.
+
+    Строки пересчитываются в recipes.shopping_list при изменении корзины
+    и ингредиентов рецептов в ней, команда rebuild_shopping_lists
+    пересчитывает их полностью.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='user',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='ingredient',
+    )
+    total_amount = models.PositiveIntegerField(
+        verbose_name='total amount',
+    )
+
+    class Meta:
+        verbose_name = 'Shopping list item'
+        verbose_name_plural = 'Shopping list items'
+        constraints = [
+            models.UniqueConstraint(
+                fields=[
+                    'user',
+                    'ingredient',
+                ],
+                name='unique shopping list ingredient'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.ingredient}: {self.total_amount}'
+
+
+class RecipeScore(models.Model):
+    """
+    Оценки рецепта для сортировок popular и trending.
+
+    Изменения избранного и корзин помечают оценку устаревшей, команда
+    update_recipe_scores пересчитывает только помеченные оценки.
+    """
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='score',
+        verbose_name='recipe',
+    )
+    popularity = models.PositiveIntegerField(
+        verbose_name='popularity',
+        default=0,
+    )
+    trending = models.FloatField(
+        verbose_name='trending',
+        default=0,
+    )
+    stale = models.BooleanField(
+        verbose_name='needs recalculation',
+        default=False,
+    )
+
+    class Meta:
+        verbose_name = 'Recipe score'
+        verbose_name_plural = 'Recipe scores'
+        indexes = [
+            models.Index(
+                fields=['-trending', '-recipe'],
+                name='recipe_score_trending_idx'
+            ),
+            models.Index(
+                fields=['-popularity', '-recipe'],
+                name='recipe_score_popularity_idx'
+            ),
+            models.Index(
+                fields=['recipe'],
+                condition=Q(stale=True),
+                name='recipe_score_stale_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.popularity}, {self.trending:.3f}'
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import time
+from threading import Lock
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Ingredient, Tag
+
+REFERENCE_DATA_TIMEOUT = 60 * 60 * 24
+
+
+class CacheVersion:
+    """
+    Номер версии данных в кэше Django, общий для всех воркеров.
+
+    Начальная версия берётся из текущего времени, чтобы после вытеснения
+    или истечения ключа версии не повторялись. Поэтому версиям, которых
+    может быть много, можно задать timeout.
+    """
+
+    def __init__(self, key, timeout=None):
+        self.key = key
+        self.timeout = timeout
+
+    def get(self):
+        version = cache.get(self.key)
+        if version is not None:
+            return version
+        initial = time.time_ns()
+        cache.add(self.key, initial, self.timeout)
+        return cache.get(self.key, initial)
+
+    def bump(self):
+        try:
+            cache.incr(self.key)
+        except ValueError:
+            cache.add(self.key, time.time_ns(), self.timeout)
+
+    def bump_on_commit(self):
+        """Смена версии после фиксации транзакции, изменившей данные."""
+        transaction.on_commit(self.bump)
+
+
+class Snapshot:
+    """Неизменяемый срез справочника: строки, индекс по id и готовый JSON."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.by_id = {row['id']: row for row in rows}
+        self.payload = json.dumps(
+            rows,
+            ensure_ascii=False,
+            separators=(',', ':')
+        ).encode()
+        self.etag = f'"{hashlib.sha1(self.payload).hexdigest()}"'
+
+
+class ReferenceData:
+    """
+    Кэш редко изменяемого справочника в памяти процесса и в кэше Django.
+
+    Актуальная версия справочника хранится в кэше Django и увеличивается при
+    каждом изменении модели, поэтому все воркеры замечают изменения. Срез
+    для каждой версии также кладётся в кэш Django, и воркер со
+    устаревшим срезом читает его оттуда, а не из БД.
+    """
+
+    def __init__(self, name, model, fields):
+        self.model = model
+        self.fields = fields
+        self.version = CacheVersion(f'reference:{name}:version')
+        self.rows_key = f'reference:{name}:rows:{{version}}'
+        self._lock = Lock()
+        self._version = None
+        self._snapshot = None
+
+    def load_rows(self, version):
+        rows_key = self.rows_key.format(version=version)
+        rows = cache.get(rows_key)
+        if rows is None:
+            rows = list(self.model.objects.values(*self.fields))
+            cache.set(rows_key, rows, REFERENCE_DATA_TIMEOUT)
+        return rows
+
+    def get_snapshot(self):
+        version = self.version.get()
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self._snapshot = Snapshot(self.load_rows(version))
+                    self._version = version
+        return self._snapshot
+
+    def invalidate(self):
+        self.version.bump_on_commit()
+
+
+tag_reference = ReferenceData(
+    'tags',
+    Tag,
+    ('id', 'name', 'color', 'slug')
+)
+ingredient_reference = ReferenceData(
+    'ingredients',
+    Ingredient,
+    ('id', 'name', 'measurement_unit')
+)
@@ -0,0 +1,186 @@
+import hashlib
+import json
+from threading import local
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Recipe
+from .reference import CacheVersion, tag_reference
+
+RESPONSE_CACHE_TIMEOUT = getattr(
+    settings, 'RECIPE_RESPONSE_CACHE_TIMEOUT', 60 * 10
+)
+AUTHOR_FIELDS = {'username', 'email', 'first_name', 'last_name', 'role'}
+POPULARITY_FIELDS = ('favorites_count', 'in_carts_count')
+SCORE_ORDERINGS = ('popular', 'trending')
+
+_pending = local()
+
+# Меняется при любом изменении, влияющем на список рецептов без фильтра
+# по автору или тегам.
+list_version = CacheVersion('response_cache:recipes:list')
+# Меняется при изменении тегов и ингредиентов, которые есть в любом ответе.
+shared_version = CacheVersion('response_cache:recipes:shared')
+# Меняется вместе со счётчиками избранного и корзин, от которых зависит
+# только порядок списка при сортировке по этим счётчикам.
+popularity_version = CacheVersion('response_cache:recipes:popularity')
+# Меняется после пересчёта оценок командой update_recipe_scores.
+score_version = CacheVersion('response_cache:recipes:scores')
+
+
+def recipe_version(recipe_id):
+    return CacheVersion(
+        f'response_cache:recipe:{recipe_id}',
+        RESPONSE_CACHE_TIMEOUT
+    )
+
+
+def author_version(author_id):
+    """Меняется при изменении рецептов автора, ключ списков с ?author=."""
+    return CacheVersion(
+        f'response_cache:recipes:author:{author_id}',
+        RESPONSE_CACHE_TIMEOUT
+    )
+
+
+def tag_version(tag_id):
+    """Меняется при изменении рецептов с тегом, ключ списков с ?tags=."""
+    return CacheVersion(
+        f'response_cache:recipes:tag:{tag_id}',
+        RESPONSE_CACHE_TIMEOUT
+    )
+
+
+def make_key(request, kind, *parts):
+    """
+    Ключ ответа по схеме, Host, пути и параметрам запроса.
+
+    Тело списка содержит абсолютные ссылки пагинации, построенные по схеме
+    и Host запроса, поэтому они входят в ключ. get_host() проверяет Host
+    по ALLOWED_HOSTS, и произвольный Host не создаёт новых записей.
+    """
+    raw = json.dumps(
+        [kind, request.scheme, request.get_host(), request.path, *parts],
+        ensure_ascii=False,
+        separators=(',', ':')
+    )
+    return f'response_cache:{hashlib.sha1(raw.encode()).hexdigest()}'
+
+
+def get_scope_versions(request):
+    """
+    Версии, от которых зависит список с фильтром по автору или тегам.
+
+    Такой список меняется только вместе с рецептами этих авторов или
+    тегов. Для списков без этих фильтров и с неизвестными значениями
+    возвращается общая версия списков.
+    """
+    authors = set(request.query_params.getlist('author')) - {''}
+    if authors and all(author.isdigit() for author in authors):
+        return [author_version(int(author)).get() for author in sorted(
+            authors,
+            key=int
+        )]
+    slugs = set(request.query_params.getlist('tags')) - {''}
+    tags = {
+        tag['slug']: tag['id'] for tag in tag_reference.get_snapshot().rows
+    }
+    if slugs and slugs <= tags.keys():
+        return [tag_version(tags[slug]).get() for slug in sorted(slugs)]
+    return [list_version.get()]
+
+
+def get_list_key(request):
+    """
+    Ключ ответа списка по нормализованным параметрам запроса.
+
+    Параметры сортируются, пустые значения отбрасываются, как их
+    отбрасывают фильтры, поэтому ?a=1&b=2 и ?b=2&a=1&c= дают один ключ.
+    """
+    params = sorted(
+        (key, value)
+        for key, values in request.query_params.lists()
+        for value in values
+        if value != ''
+    )
+    versions = [shared_version.get(), *get_scope_versions(request)]
+    ordering = request.query_params.get('ordering', '')
+    if any(field in ordering for field in POPULARITY_FIELDS):
+        versions.append(popularity_version.get())
+    if ordering in SCORE_ORDERINGS:
+        versions.append(score_version.get())
+    return make_key(request, 'list', params, versions)
+
+
+def get_detail_key(request, recipe_id):
+    versions = [shared_version.get(), recipe_version(recipe_id).get()]
+    return make_key(request, 'detail', recipe_id, versions)
+
+
+def get_entry(key):
+    return cache.get(key)
+
+
+def set_entry(key, payload):
+    """Сохраняет тело ответа и возвращает пару (тело, ETag)."""
+    entry = (payload, f'"{hashlib.sha1(payload).hexdigest()}"')
+    cache.set(key, entry, RESPONSE_CACHE_TIMEOUT)
+    return entry
+
+
+def flush_recipe_invalidations():
+    recipe_ids = getattr(_pending, 'recipe_ids', None) or set()
+    author_ids = getattr(_pending, 'author_ids', None) or set()
+    tag_ids = getattr(_pending, 'tag_ids', None) or set()
+    _pending.recipe_ids = set()
+    _pending.author_ids = set()
+    _pending.tag_ids = set()
+    if not (recipe_ids or author_ids or tag_ids):
+        return
+    if recipe_ids:
+        author_ids.update(Recipe.objects.filter(
+            pk__in=recipe_ids
+        ).values_list('author_id', flat=True))
+        tag_ids.update(Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('tag_id', flat=True))
+    list_version.bump()
+    for recipe_id in recipe_ids:
+        recipe_version(recipe_id).bump()
+    for author_id in author_ids:
+        author_version(author_id).bump()
+    for tag_id in tag_ids:
+        tag_version(tag_id).bump()
+
+
+def invalidate_recipes(recipe_ids, author_ids=(), tag_ids=()):
+    """
+    Сброс ответов с рецептами recipe_ids после фиксации транзакции.
+
+    Авторы и теги рецептов определяются после фиксации одним запросом на
+    все изменённые рецепты. Удаляемый рецепт к этому моменту уже не
+    найти, и его автора и теги нужно передать явно, как и теги, снятые
+    с рецепта.
+    """
+    if not hasattr(_pending, 'recipe_ids'):
+        _pending.recipe_ids = set()
+        _pending.author_ids = set()
+        _pending.tag_ids = set()
+    _pending.recipe_ids.update(recipe_ids)
+    _pending.author_ids.update(author_ids)
+    _pending.tag_ids.update(tag_ids)
+    transaction.on_commit(flush_recipe_invalidations)
+
+
+def invalidate_shared():
+    shared_version.bump_on_commit()
+
+
+def invalidate_popularity():
+    popularity_version.bump_on_commit()
+
+
+def invalidate_scores():
+    score_version.bump_on_commit()
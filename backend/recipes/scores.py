@@ -0,0 +1,66 @@
+import math
+from collections import defaultdict
+from datetime import datetime
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Favorite, RecipeScore, ShoppingCart
+
+TRENDING_HALF_LIFE = getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 72) * 3600
+DECAY = math.log(2) / TRENDING_HALF_LIFE
+EPOCH = datetime(2021, 1, 1, tzinfo=timezone.utc)
+# Добавление в корзину говорит о намерении приготовить и весит больше.
+WEIGHTS = (
+    (Favorite, 1),
+    (ShoppingCart, 2),
+)
+BATCH_SIZE = 500
+
+
+def get_trending(events):
+    """
+    Сумма весов событий, убывающих вдвое за TRENDING_HALF_LIFE.
+
+    Вместо затухания старых событий вклад новых растёт от EPOCH:
+    порядок рецептов от этого не меняется, а оценки без новых событий
+    не нужно пересчитывать. Хранится логарифм log(1 + сумма), который
+    считается без переполнения через log-sum-exp.
+    """
+    exponents = [
+        math.log(weight) + DECAY * (created - EPOCH).total_seconds()
+        for weight, created in events
+    ]
+    top = max(exponents + [0.0])
+    return top + math.log(
+        math.exp(-top) + sum(math.exp(value - top) for value in exponents)
+    )
+
+
+def update_scores(recipe_ids):
+    """Пересчитывает оценки рецептов по текущему избранному и корзинам."""
+    events = defaultdict(list)
+    for model, weight in WEIGHTS:
+        for recipe_id, created in model.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'created').iterator():
+            events[recipe_id].append((weight, created))
+    RecipeScore.objects.bulk_update(
+        [
+            RecipeScore(
+                recipe_id=recipe_id,
+                popularity=sum(weight for weight, _ in events[recipe_id]),
+                trending=get_trending(events[recipe_id])
+            )
+            for recipe_id in recipe_ids
+        ],
+        ('popularity', 'trending'),
+        batch_size=BATCH_SIZE
+    )
+
+
+def mark_stale(recipe_ids):
+    RecipeScore.objects.filter(
+        recipe_id__in=recipe_ids,
+        stale=False
+    ).update(stale=True)
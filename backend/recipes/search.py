@@ -0,0 +1,84 @@
+from threading import local
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector
+)
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Q, Subquery
+
+from .models import Recipe, RecipeIngredient
+
+SEARCH_CONFIG = getattr(settings, 'SEARCH_CONFIG', 'russian')
+
+_pending = local()
+
+
+def is_search_supported():
+    return connection.vendor == 'postgresql'
+
+
+def get_search_vector():
+    """Вектор из названия, ингредиентов и описания рецепта с весами A-C."""
+    ingredient_names = Subquery(
+        RecipeIngredient.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            names=StringAgg('ingredient__name', delimiter=' ')
+        ).values('names')
+    )
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(ingredient_names, weight='B', config=SEARCH_CONFIG)
+        + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vector(recipe_ids):
+    """Пересчёт поля search_vector для рецептов с id из recipe_ids."""
+    if not is_search_supported():
+        return
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        search_vector=get_search_vector()
+    )
+
+
+def flush_search_vector_updates():
+    recipe_ids = getattr(_pending, 'recipe_ids', None)
+    _pending.recipe_ids = set()
+    if recipe_ids:
+        update_search_vector(recipe_ids)
+
+
+def schedule_search_vector_update(recipe_id):
+    """
+    Отложенный до фиксации транзакции пересчёт search_vector.
+
+    Изменения нескольких строк рецепта в одной транзакции приводят к
+    одному UPDATE на все затронутые рецепты.
+    """
+    if not hasattr(_pending, 'recipe_ids'):
+        _pending.recipe_ids = set()
+    _pending.recipe_ids.add(recipe_id)
+    transaction.on_commit(flush_search_vector_updates)
+
+
+def search_recipes(queryset, value):
+    """
+    Полнотекстовый поиск по рецептам с сортировкой по релевантности.
+
+    Без PostgreSQL поиск сводится к поиску подстроки в тех же полях.
+    """
+    if not is_search_supported():
+        return queryset.filter(
+            Q(name__icontains=value)
+            | Q(text__icontains=value)
+            | Q(ingredients__name__icontains=value)
+        ).distinct()
+    query = SearchQuery(value, config=SEARCH_CONFIG)
+    return queryset.filter(search_vector=query).annotate(
+        rank=SearchRank(F('search_vector'), query)
+    ).order_by('-rank', '-pub_date')
@@ -1,18 +1,33 @@
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+
 from rest_framework import serializers
 
 from drf_extra_fields.fields import Base64ImageField
 from users.serializers import CustomUserSerializer
 
+from .images import (
+    RENDITION_FIELDS,
+    get_file_names,
+    image_pipeline,
+    release_files_on_commit
+)
+from .matching import recipe_matching_index
 from .models import (
     Favorite,
     Ingredient,
     Recipe,
     RecipeIngredient,
     ShoppingCart,
+    ShoppingListItem,
     Tag
 )
+from .reference import tag_reference
+from .search import schedule_search_vector_update
+from .shopping_list import schedule_recipe_refresh
 
 MIN_INGR_AMOUNT = 0.1
+MAX_BULK_RECIPES = 100
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -92,8 +107,9 @@ class IngredientCreateInRecipeSerializer(serializers.Serializer):
 
 
 class RecipeIngredientSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(), source='ingredient')
+    id = serializers.IntegerField(
+        source='ingredient_id'
+    )
 
     class Meta:
         model = RecipeIngredient
@@ -103,11 +119,45 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         )
 
 
+def attach_tag_ids(recipes):
+    """Одним запросом к промежуточной таблице добавляет рецептам tag_ids."""
+    recipes = [recipe for recipe in recipes if not hasattr(recipe, 'tag_ids')]
+    tag_ids = {recipe.pk: [] for recipe in recipes}
+    if not tag_ids:
+        return
+    for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+            recipe_id__in=tag_ids
+    ).order_by('tag_id').values_list('recipe_id', 'tag_id'):
+        tag_ids[recipe_id].append(tag_id)
+    for recipe in recipes:
+        recipe.tag_ids = tag_ids[recipe.pk]
+
+
+class CachedTagsField(serializers.Field):
+    """Теги рецепта из кэша справочника вместо JOIN с таблицей тегов."""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        attach_tag_ids([recipe])
+        tags = tag_reference.get_snapshot().by_id
+        return [tags[pk] for pk in recipe.tag_ids if pk in tags]
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        if isinstance(data, models.Manager):
+            data = data.all()
+        data = list(data)
+        attach_tag_ids(data)
+        return super().to_representation(data)
+
+
 class RecipeViewSerializer(serializers.ModelSerializer):
-    tags = TagSerializer(
-        many=True,
-        read_only=True
-    )
+    tags = CachedTagsField()
     author = CustomUserSerializer(
         read_only=True
     )
@@ -125,6 +175,9 @@ class RecipeViewSerializer(serializers.ModelSerializer):
             'name',
             'author',
             'image',
+            'image_thumbnail',
+            'image_card',
+            'image_full',
             'cooking_time',
             'tags',
             'ingredients',
@@ -132,8 +185,11 @@ class RecipeViewSerializer(serializers.ModelSerializer):
             'is_favorited',
             'is_in_shopping_cart'
         )
+        list_serializer_class = RecipeListSerializer
 
     def get_is_favorited(self, recipe):
+        if hasattr(recipe, 'is_favorited'):
+            return recipe.is_favorited
         current_user = self.context['request'].user
         if current_user.is_authenticated and Favorite.objects.filter(
                 recipe=recipe,
@@ -143,6 +199,8 @@ class RecipeViewSerializer(serializers.ModelSerializer):
         return False
 
     def get_is_in_shopping_cart(self, recipe):
+        if hasattr(recipe, 'is_in_shopping_cart'):
+            return recipe.is_in_shopping_cart
         current_user = self.context['request'].user
         if current_user.is_authenticated and ShoppingCart.objects.filter(
                 recipe=recipe,
@@ -156,9 +214,8 @@ class RecipeSerializer(serializers.ModelSerializer):
     image = Base64ImageField(
         required=False
     )
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True
+    tags = serializers.ListField(
+        child=serializers.IntegerField()
     )
     author = CustomUserSerializer(
         read_only=True
@@ -199,6 +256,40 @@ class RecipeSerializer(serializers.ModelSerializer):
             user=current_user
         ).exists()
 
+    @staticmethod
+    def get_objects(model, ids):
+        """Объекты model с id из ids, найденные одним запросом in_bulk."""
+        objects = model.objects.in_bulk(set(ids))
+        for pk in ids:
+            if pk not in objects:
+                raise serializers.ValidationError(
+                    serializers.PrimaryKeyRelatedField.default_error_messages[
+                        'does_not_exist'
+                    ].format(pk_value=pk)
+                )
+        return objects
+
+    def validate_tags(self, tag_ids):
+        tags = self.get_objects(Tag, tag_ids)
+        return [tags[pk] for pk in dict.fromkeys(tag_ids)]
+
+    def validate_ingredients(self, ingredients_data):
+        ingredient_ids = [
+            ingredient['ingredient_id'] for ingredient in ingredients_data
+        ]
+        if len(set(ingredient_ids)) != len(ingredient_ids):
+            raise serializers.ValidationError(
+                'Ingredients in the recipe must not repeat.'
+            )
+        ingredients = self.get_objects(Ingredient, ingredient_ids)
+        return [
+            {
+                'ingredient': ingredients[ingredient['ingredient_id']],
+                'amount': ingredient['amount']
+            }
+            for ingredient in ingredients_data
+        ]
+
     @staticmethod
     def __add_ingredients_in_recipe(ingredients_data, recipe):
         RecipeIngredient.objects.bulk_create([
@@ -210,26 +301,101 @@ class RecipeSerializer(serializers.ModelSerializer):
             for ingredient in ingredients_data
         ])
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('recipeingredient_set')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
-        for tag in tags:
-            recipe.tags.add(tag)
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for tag in tags
+        ])
         self.__add_ingredients_in_recipe(ingredients, recipe)
+        if recipe.image:
+            image_pipeline.submit_on_commit(recipe.pk)
+        schedule_search_vector_update(recipe.pk)
+        recipe_matching_index.invalidate([recipe.pk])
         return recipe
 
+    @staticmethod
+    def __update_ingredients_in_recipe(ingredients_data, recipe):
+        """Изменяет только добавленные, удалённые и изменённые ингредиенты."""
+        amounts = {
+            ingredient['ingredient'].id: ingredient['amount']
+            for ingredient in ingredients_data
+        }
+        existing = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in RecipeIngredient.objects.filter(
+                recipe=recipe
+            )
+        }
+        removed = [
+            recipe_ingredient.pk
+            for ingredient_id, recipe_ingredient in existing.items()
+            if ingredient_id not in amounts
+        ]
+        changed = []
+        for ingredient_id, amount in amounts.items():
+            recipe_ingredient = existing.get(ingredient_id)
+            if recipe_ingredient is not None and (
+                    recipe_ingredient.amount != amount):
+                recipe_ingredient.amount = amount
+                changed.append(recipe_ingredient)
+        if removed:
+            RecipeIngredient.objects.filter(pk__in=removed).delete()
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
+                ingredient_id=ingredient_id,
+                recipe=recipe,
+                amount=amount
+            )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in existing
+        ])
+        recipe_matching_index.invalidate([recipe.pk])
+        # bulk_create и bulk_update не посылают сигналов, поэтому списки
+        # покупок пересчитываются явно.
+        affected = (amounts.keys() ^ existing.keys()) | {
+            recipe_ingredient.ingredient_id for recipe_ingredient in changed
+        }
+        if affected:
+            schedule_recipe_refresh(recipe.pk, affected)
+
+    @transaction.atomic
     def update(self, recipe, validated_data, ):
-        recipe.tags.clear()
-        RecipeIngredient.objects.filter(recipe=recipe).delete()
         if 'tags' in validated_data:
-            tags_data = validated_data.pop('tags')
-            recipe.tags.set(tags_data)
-        self.__add_ingredients_in_recipe(
-            validated_data.pop('recipeingredient_set'), recipe)
-        return super().update(recipe, validated_data)
+            recipe.tags.set(validated_data.pop('tags'))
+        if 'recipeingredient_set' in validated_data:
+            self.__update_ingredients_in_recipe(
+                validated_data.pop('recipeingredient_set'), recipe)
+        if 'image' not in validated_data:
+            return super().update(recipe, validated_data)
+        old_files = get_file_names(recipe)
+        image = validated_data['image']
+        if image:
+            # Повторно загруженная та же картинка получает то же имя в
+            # хранилище, и её копии не нужно пересоздавать.
+            validated_data['image'] = default_storage.save(
+                Recipe.image.field.generate_filename(recipe, image.name),
+                image
+            )
+        if validated_data['image'] != recipe.image.name:
+            validated_data.update(dict.fromkeys(RENDITION_FIELDS, ''))
+            if image:
+                image_pipeline.submit_on_commit(recipe.pk)
+        recipe = super().update(recipe, validated_data)
+        release_files_on_commit(old_files - get_file_names(recipe))
+        return recipe
 
     def to_representation(self, recipe):
+        # Рецепт перечитывается запросом представления: ингредиенты и
+        # автор загружаются prefetch, флаги пользователя - аннотациями.
+        view = self.context.get('view')
+        if view is not None:
+            recipe = view.get_queryset().get(pk=recipe.pk)
         serializer = RecipeViewSerializer(
             recipe,
             context=self.context
@@ -258,6 +424,7 @@ class FavoriteSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_thumbnail',
             'cooking_time',
         )
 
@@ -299,3 +466,38 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
             ingredient,
             many=True
         ).data
+
+
+class ShoppingListItemSerializer(serializers.ModelSerializer):
+    id = serializers.ReadOnlyField(
+        source='ingredient.id'
+    )
+    name = serializers.ReadOnlyField(
+        source='ingredient.name'
+    )
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit'
+    )
+    amount = serializers.ReadOnlyField(
+        source='total_amount'
+    )
+
+    class Meta:
+        model = ShoppingListItem
+        fields = (
+            'id',
+            'name',
+            'measurement_unit',
+            'amount'
+        )
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BULK_RECIPES
+    )
+
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
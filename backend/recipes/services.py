@@ -1,65 +1,202 @@
+import csv
+import os
+from functools import lru_cache
 from io import BytesIO
+from tempfile import TemporaryFile
 
-from django.db.models import Sum
-from django.http import FileResponse
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.http import FileResponse, StreamingHttpResponse
 
-from recipes.models import RecipeIngredient
+from recipes.models import ShoppingListItem
+from recipes.shopping_list import get_list_version
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfgen import canvas
 
+FONT = 'arial'
+FONT_PATH = os.path.join(settings.BASE_DIR, 'arial.ttf')
+FONT_SIZE_TITLE = 24
+FONT_SIZE_TEXT = 14
+PIXELS_FROM_LEFT_TITLE = 150
+PIXELS_FROM_DOWN_TITLE = 800
+PIXELS_FROM_LEFT_TEXT = 50
+PIXELS_FROM_DOWN_TEXT = 700
+PIXELS_FROM_DOWN_PAGE = 760
+PIXELS_BOTTOM_MARGIN = 50
+PIXELS_SUBTRACTION = 20
 
-def get_pdf(user):
-    """Получение файла PDF."""
-    font = 'arial'
-    pdfmetrics.registerFont(
-        TTFont(
-            'arial',
-            'arial.ttf',
-            'UTF-8'
-        )
-    )
-    font_size_title = 24
-    font_size_text = 14
-    pixels_from_top_title = 150
-    pixels_from_down_title = 800
-    pixels_from_left_text = 50
-    pixels_from_bottom_text_str = 700
-    pixels_subtraction = 20
+SHOPPING_LIST_TITLE = 'Shopping list'
+SHOPPING_LIST_FILENAME = 'shopping_list'
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60
+SHOPPING_LIST_STREAM_THRESHOLD = 1000
+
+
+class ExportFormat:
+    PDF = 'pdf'
+    TXT = 'txt'
+    CSV = 'csv'
+
+    CONTENT_TYPES = {
+        PDF: 'application/pdf',
+        TXT: 'text/plain; charset=utf-8',
+        CSV: 'text/csv; charset=utf-8',
+    }
+
+
+class Echo:
+    """Объект с интерфейсом файла для csv.writer, возвращающий строку."""
+
+    def write(self, value):
+        return value
 
-    buffer = BytesIO()
-    buffer_seek_count = 0
-    pdf = canvas.Canvas(buffer)
-    pdf.setFont(font, font_size_title)
-    pdf.drawString(
-        pixels_from_top_title,
-        pixels_from_down_title,
-        'Shopping list'
-    )
-    pdf.setFont(font, font_size_text)
 
-    user = user
-    ingredients = RecipeIngredient.objects.filter(
-        recipe__shopping_cart__user=user).values(
+@lru_cache(maxsize=None)
+def register_fonts():
+    """Регистрация шрифта выполняется один раз на процесс."""
+    pdfmetrics.registerFont(TTFont(FONT, FONT_PATH))
+
+
+def get_shopping_list(user):
+    """Суммарный список ингредиентов из корзины пользователя."""
+    return ShoppingListItem.objects.filter(user=user).values(
         'ingredient__name',
         'ingredient__measurement_unit'
-    ).annotate(amount=Sum('amount'))
+    ).annotate(amount=F('total_amount')).order_by('ingredient__name')
+
+
+def get_cache_key(user, export_format):
+    """Ключ готового файла по версии списка, без запросов к БД."""
+    lists_version, user_version = get_list_version(user.pk)
+    return (
+        f'shopping_list:{export_format}:{user.pk}:'
+        f'{lists_version}:{user_version}'
+    )
+
+
+def format_ingredient(ingredient):
+    return (
+        f"{ingredient['ingredient__name']} - {ingredient['amount']} "
+        f"{ingredient['ingredient__measurement_unit']}"
+    )
+
+
+def iter_txt(ingredients):
+    yield f'{SHOPPING_LIST_TITLE}\n\n'.encode()
+    for ingredient in ingredients:
+        yield f'{format_ingredient(ingredient)}\n'.encode()
+
+
+def iter_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'amount', 'measurement_unit')).encode()
     for ingredient in ingredients:
-        shopping_cart = '\n'.join([
-            f"{ingredient['ingredient__name']} - {ingredient['amount']} "
-            f"{ingredient['ingredient__measurement_unit']}"
-        ])
+        yield writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['amount'],
+            ingredient['ingredient__measurement_unit'],
+        )).encode()
+
+
+def write_pdf(ingredients, output):
+    """Запись файла PDF в output с переносом строк на новые страницы."""
+    register_fonts()
+    pdf = canvas.Canvas(output)
+    pdf.setFont(FONT, FONT_SIZE_TITLE)
+    pdf.drawString(
+        PIXELS_FROM_LEFT_TITLE,
+        PIXELS_FROM_DOWN_TITLE,
+        SHOPPING_LIST_TITLE
+    )
+    pdf.setFont(FONT, FONT_SIZE_TEXT)
+    pixels_from_down = PIXELS_FROM_DOWN_TEXT
+    for ingredient in ingredients:
+        if pixels_from_down < PIXELS_BOTTOM_MARGIN:
+            pdf.showPage()
+            pdf.setFont(FONT, FONT_SIZE_TEXT)
+            pixels_from_down = PIXELS_FROM_DOWN_PAGE
         pdf.drawString(
-            pixels_from_left_text,
-            pixels_from_bottom_text_str,
-            shopping_cart
+            PIXELS_FROM_LEFT_TEXT,
+            pixels_from_down,
+            format_ingredient(ingredient)
         )
-        pixels_from_bottom_text_str -= pixels_subtraction
+        pixels_from_down -= PIXELS_SUBTRACTION
     pdf.showPage()
     pdf.save()
-    buffer.seek(buffer_seek_count)
+
+
+def render_pdf(ingredients):
+    buffer = BytesIO()
+    write_pdf(ingredients, buffer)
+    return buffer.getvalue()
+
+
+def stream_pdf(ingredients, content_type, filename):
+    """
+    PDF большого списка через временный файл.
+
+    reportlab не умеет отдавать страницы по мере готовности, поэтому
+    документ пишется на диск и отдаётся FileResponse блоками.
+    """
+    output = TemporaryFile()
+    write_pdf(ingredients, output)
+    output.seek(0)
+    return FileResponse(
+        output,
+        content_type=content_type,
+        as_attachment=True,
+        filename=filename,
+    )
+
+
+RENDERERS = {
+    ExportFormat.PDF: render_pdf,
+    ExportFormat.TXT: lambda ingredients: b''.join(iter_txt(ingredients)),
+    ExportFormat.CSV: lambda ingredients: b''.join(iter_csv(ingredients)),
+}
+
+STREAMERS = {
+    ExportFormat.TXT: iter_txt,
+    ExportFormat.CSV: iter_csv,
+}
+
+
+def export_shopping_list(user, export_format=ExportFormat.PDF):
+    """
+    Выгрузка списка покупок в одном из форматов ExportFormat.
+
+    Готовый файл кэшируется по версии списка покупок пользователя,
+    поэтому повторная выгрузка неизменённого списка обходится без
+    запросов к БД. Большие списки не кэшируются: строки читаются
+    итератором, текст отдаётся потоком, PDF — через временный файл.
+    """
+    content_type = ExportFormat.CONTENT_TYPES[export_format]
+    filename = f'{SHOPPING_LIST_FILENAME}.{export_format}'
+    cache_key = get_cache_key(user, export_format)
+    content = cache.get(cache_key)
+    if content is None:
+        ingredients = get_shopping_list(user)
+        if ingredients.count() > SHOPPING_LIST_STREAM_THRESHOLD:
+            if export_format not in STREAMERS:
+                return stream_pdf(
+                    ingredients.iterator(),
+                    content_type,
+                    filename
+                )
+            response = StreamingHttpResponse(
+                STREAMERS[export_format](ingredients.iterator()),
+                content_type=content_type
+            )
+            response['Content-Disposition'] = (
+                f'attachment; filename="{filename}"'
+            )
+            return response
+        content = RENDERERS[export_format](ingredients)
+        cache.set(cache_key, content, SHOPPING_LIST_CACHE_TIMEOUT)
     return FileResponse(
-        buffer,
-        content_type='application/pdf',
+        BytesIO(content),
+        content_type=content_type,
         as_attachment=True,
+        filename=filename,
     )
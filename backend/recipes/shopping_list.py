@@ -0,0 +1,177 @@
+from collections import defaultdict
+from threading import local
+
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from users.models import User
+from .models import RecipeIngredient, ShoppingCart, ShoppingListItem
+from .reference import CacheVersion
+
+UPSERT_BATCH_SIZE = 500
+UPSERT_SQL = (
+    'INSERT INTO {table} ({user}, {ingredient}, {total}) VALUES {values} '
+    'ON CONFLICT ({user}, {ingredient}) DO UPDATE SET {total} = '
+    'EXCLUDED.{total}'
+)
+
+_pending = local()
+# Меняется при полном пересчёте командой rebuild_shopping_lists.
+all_lists_version = CacheVersion('shopping_list:version')
+
+
+def user_list_version(user_id):
+    """Меняется при изменении строк списка покупок пользователя."""
+    return CacheVersion(f'shopping_list:{user_id}:version')
+
+
+def get_list_version(user_id):
+    """Версия списка покупок пользователя без запросов к БД."""
+    return all_lists_version.get(), user_list_version(user_id).get()
+
+
+def upsert_items(rows):
+    """
+    Вставляет или обновляет строки (user_id, ingredient_id, total_amount).
+
+    INSERT ... ON CONFLICT поддерживают PostgreSQL и SQLite 3.24+, а
+    bulk_create в этой версии Django так не умеет.
+    """
+    meta = ShoppingListItem._meta
+    quote = connection.ops.quote_name
+    names = {
+        'table': quote(meta.db_table),
+        'user': quote(meta.get_field('user').column),
+        'ingredient': quote(meta.get_field('ingredient').column),
+        'total': quote(meta.get_field('total_amount').column),
+    }
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[start:start + UPSERT_BATCH_SIZE]
+            cursor.execute(
+                UPSERT_SQL.format(
+                    values=', '.join(['(%s, %s, %s)'] * len(batch)),
+                    **names
+                ),
+                [value for row in batch for value in row]
+            )
+
+
+def refresh_shopping_lists(user_ids, ingredient_ids=None):
+    """
+    Пересчитывает строки ShoppingListItem пользователей для ingredient_ids.
+
+    Суммы считаются заново по корзинам только для затронутых ингредиентов,
+    поэтому повторный или лишний пересчёт не искажает списки. Без
+    ingredient_ids списки пересчитываются целиком. Строки пользователей
+    блокируются до конца пересчёта, поэтому параллельные пересчёты одного
+    списка выполняются по очереди и каждый читает корзину после
+    предыдущего. Число запросов не зависит от числа пользователей.
+    """
+    with transaction.atomic():
+        list(User.objects.select_for_update().filter(
+            pk__in=user_ids
+        ).order_by('pk').values_list('pk', flat=True))
+        ingredients = RecipeIngredient.objects.filter(
+            recipe__shopping_cart__user_id__in=user_ids
+        )
+        items = ShoppingListItem.objects.filter(user_id__in=user_ids)
+        if ingredient_ids is not None:
+            ingredients = ingredients.filter(ingredient_id__in=ingredient_ids)
+            items = items.filter(ingredient_id__in=ingredient_ids)
+        ingredients = ingredients.order_by().values(
+            'recipe__shopping_cart__user', 'ingredient_id'
+        ).annotate(total=Sum('amount')).values_list(
+            'recipe__shopping_cart__user', 'ingredient_id', 'total'
+        )
+        totals = {
+            (user_id, ingredient_id): total
+            for user_id, ingredient_id, total in ingredients
+        }
+        existing = {
+            (user_id, ingredient_id): (pk, total)
+            for pk, user_id, ingredient_id, total in items.values_list(
+                'pk', 'user_id', 'ingredient_id', 'total_amount'
+            )
+        }
+        removed = [
+            pk for key, (pk, _) in existing.items() if key not in totals
+        ]
+        upserted = [
+            (user_id, ingredient_id, total)
+            for (user_id, ingredient_id), total in totals.items()
+            if existing.get((user_id, ingredient_id), (None, None))[1]
+            != total
+        ]
+        if removed:
+            ShoppingListItem.objects.filter(pk__in=removed).delete()
+        if upserted:
+            upsert_items(upserted)
+        for user_id in {user_id for user_id, _, _ in upserted} | {
+            user_id for user_id, _ in existing.keys() - totals.keys()
+        }:
+            user_list_version(user_id).bump_on_commit()
+
+
+def _merge(pending, key, ingredient_ids):
+    """Объединяет ингредиенты, None означает пересчёт целиком."""
+    if ingredient_ids is None:
+        pending[key] = None
+    elif pending.get(key, ()) is not None:
+        pending.setdefault(key, set()).update(ingredient_ids)
+
+
+def flush_shopping_list_refreshes():
+    users = getattr(_pending, 'users', None) or {}
+    recipes = getattr(_pending, 'recipes', None) or {}
+    _pending.users = {}
+    _pending.recipes = {}
+    carts = ShoppingCart.objects.filter(
+        recipe_id__in=recipes
+    ).values_list('user_id', 'recipe_id') if recipes else ()
+    for user_id, recipe_id in carts:
+        _merge(users, user_id, recipes[recipe_id])
+    groups = defaultdict(list)
+    for user_id, ingredient_ids in users.items():
+        key = None if ingredient_ids is None else frozenset(ingredient_ids)
+        groups[key].append(user_id)
+    for ingredient_ids, user_ids in groups.items():
+        refresh_shopping_lists(user_ids, ingredient_ids)
+
+
+def _get_pending():
+    if not hasattr(_pending, 'users'):
+        _pending.users = {}
+        _pending.recipes = {}
+    return _pending
+
+
+def schedule_refresh(user_ids, ingredient_ids=None):
+    """
+    Отложенный до фиксации транзакции пересчёт списков покупок.
+
+    Изменения в одной транзакции объединяются: каждый список
+    пересчитывается один раз по всем затронутым ингредиентам.
+    """
+    pending = _get_pending()
+    for user_id in user_ids:
+        _merge(pending.users, user_id, ingredient_ids)
+    transaction.on_commit(flush_shopping_list_refreshes)
+
+
+def schedule_cart_refresh(user_id, recipe_id):
+    """Пересчёт после добавления рецепта в корзину или удаления из неё."""
+    schedule_refresh([user_id], RecipeIngredient.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('ingredient_id', flat=True))
+
+
+def schedule_recipe_refresh(recipe_id, ingredient_ids=None):
+    """
+    Пересчёт списков всех, у кого рецепт в корзине.
+
+    Владельцы корзин определяются после фиксации транзакции одним
+    запросом на все изменённые рецепты.
+    """
+    _merge(_get_pending().recipes, recipe_id, ingredient_ids)
+    transaction.on_commit(flush_shopping_list_refreshes)
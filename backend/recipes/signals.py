@@ -0,0 +1,225 @@
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete
+)
+from django.dispatch import receiver
+
+from users.models import User, update_counter
+from .images import get_file_names, release_files_on_commit
+from .matching import recipe_matching_index
+from .models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    RecipeScore,
+    ShoppingCart,
+    Tag
+)
+from .reference import ingredient_reference, tag_reference
+from .response_cache import (
+    AUTHOR_FIELDS,
+    invalidate_popularity,
+    invalidate_recipes,
+    invalidate_shared
+)
+from .scores import mark_stale
+from .search import schedule_search_vector_update, update_search_vector
+from .shopping_list import schedule_cart_refresh, schedule_recipe_refresh
+
+COUNTER_FIELDS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'in_carts_count',
+}
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients(**kwargs):
+    ingredient_reference.invalidate()
+    invalidate_shared()
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(**kwargs):
+    tag_reference.invalidate()
+    invalidate_shared()
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def increment_recipe_counter(sender, instance, created, **kwargs):
+    if created:
+        update_counter(
+            Recipe.objects.filter(pk=instance.recipe_id),
+            COUNTER_FIELDS[sender],
+            1
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def decrement_recipe_counter(sender, instance, **kwargs):
+    update_counter(
+        Recipe.objects.filter(pk=instance.recipe_id),
+        COUNTER_FIELDS[sender],
+        -1
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def increment_recipes_count(instance, created, **kwargs):
+    if created:
+        update_counter(
+            User.objects.filter(pk=instance.author_id),
+            'recipes_count',
+            1
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(instance, **kwargs):
+    update_counter(
+        User.objects.filter(pk=instance.author_id),
+        'recipes_count',
+        -1
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_vector(instance, **kwargs):
+    schedule_search_vector_update(instance.pk)
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def update_ingredients_search_vector(instance, **kwargs):
+    schedule_search_vector_update(instance.recipe_id)
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_recipes_search_vector(instance, created, **kwargs):
+    if not created:
+        update_search_vector(instance.recipes.values('pk'))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def update_recipe_matching_index(instance, **kwargs):
+    recipe_matching_index.invalidate([instance.pk])
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def update_recipe_ingredient_matching_index(instance, **kwargs):
+    recipe_matching_index.invalidate([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def update_recipe_tags_matching_index(instance, action, reverse, pk_set,
+                                      **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        recipe_matching_index.invalidate([instance.pk])
+    else:
+        # После очистки тегов у тега рецепты неизвестны.
+        recipe_matching_index.invalidate(pk_set)
+
+
+@receiver(post_delete, sender=Recipe)
+def release_recipe_files(instance, **kwargs):
+    release_files_on_commit(get_file_names(instance))
+
+
+@receiver(post_save, sender=Recipe)
+def invalidate_recipe_responses(instance, **kwargs):
+    invalidate_recipes([instance.pk])
+
+
+# pre_delete: теги удаляемого рецепта ещё на месте.
+@receiver(pre_delete, sender=Recipe)
+def invalidate_deleted_recipe_responses(instance, **kwargs):
+    invalidate_recipes(
+        [instance.pk],
+        author_ids=[instance.author_id],
+        tag_ids=instance.tags.values_list('pk', flat=True)
+    )
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def invalidate_recipe_ingredient_responses(instance, **kwargs):
+    invalidate_recipes([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags_responses(instance, action, reverse, pk_set,
+                                     **kwargs):
+    if action == 'pre_clear' and not reverse:
+        # После очистки снятые с рецепта теги уже не узнать.
+        invalidate_recipes(
+            [instance.pk],
+            tag_ids=instance.tags.values_list('pk', flat=True)
+        )
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_recipes([instance.pk], tag_ids=pk_set or ())
+    elif pk_set is None:
+        invalidate_shared()
+    else:
+        invalidate_recipes(pk_set, tag_ids=[instance.pk])
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_responses(instance, created, update_fields, **kwargs):
+    if created or (update_fields is not None
+                   and not AUTHOR_FIELDS.intersection(update_fields)):
+        return
+    recipe_ids = list(instance.recipes.values_list('pk', flat=True))
+    if recipe_ids:
+        invalidate_recipes(recipe_ids)
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def invalidate_popularity_responses(**kwargs):
+    invalidate_popularity()
+
+
+@receiver(post_save, sender=ShoppingCart)
+def refresh_added_cart_shopping_list(instance, created, **kwargs):
+    if created:
+        schedule_cart_refresh(instance.user_id, instance.recipe_id)
+
+
+# pre_delete: при удалении рецепта каскадом ингредиенты рецепта и
+# корзины ещё на месте, и затронутые строки списка известны.
+@receiver(pre_delete, sender=ShoppingCart)
+def refresh_removed_cart_shopping_list(instance, **kwargs):
+    schedule_cart_refresh(instance.user_id, instance.recipe_id)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def refresh_recipe_ingredient_shopping_lists(instance, created, **kwargs):
+    # Изменённая строка могла сменить ингредиент, тогда прежний ингредиент
+    # неизвестен, и списки пересчитываются целиком.
+    schedule_recipe_refresh(
+        instance.recipe_id,
+        [instance.ingredient_id] if created else None
+    )
+
+
+@receiver(pre_delete, sender=RecipeIngredient)
+def refresh_removed_recipe_ingredient_shopping_lists(instance, **kwargs):
+    schedule_recipe_refresh(instance.recipe_id, [instance.ingredient_id])
+
+
+@receiver(post_save, sender=Recipe)
+def create_recipe_score(instance, created, **kwargs):
+    if created:
+        RecipeScore.objects.create(recipe=instance)
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def mark_recipe_score_stale(instance, **kwargs):
+    mark_stale([instance.recipe_id])
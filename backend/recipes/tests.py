@@ -0,0 +1,677 @@
+import json
+from unittest import mock
+
+from django.db import DatabaseError, connection
+from django.core.cache import cache
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework.test import APIClient
+
+from users.models import Follow, User
+from .autocomplete import IngredientIndex
+from .models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    RecipeScore,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag
+)
+from .reference import Snapshot
+
+RECIPES_URL = '/api/recipes/'
+
+
+class RecipeListQueriesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader',
+            email='reader@example.com',
+            password='password'
+        )
+        authors = [
+            User.objects.create_user(
+                username=f'author{number}',
+                email=f'author{number}@example.com',
+                password='password'
+            )
+            for number in range(3)
+        ]
+        Follow.objects.create(follower=cls.user, author=authors[0])
+        tags = [
+            Tag.objects.create(name=f'tag{number}', color=f'#00000{number}',
+                               slug=f'tag{number}')
+            for number in range(2)
+        ]
+        ingredients = [
+            Ingredient.objects.create(name=f'ingredient{number}',
+                                      measurement_unit='g')
+            for number in range(3)
+        ]
+        for number in range(12):
+            recipe = Recipe.objects.create(
+                author=authors[number % len(authors)],
+                name=f'recipe{number}',
+                cooking_time=10,
+                text='text'
+            )
+            recipe.tags.set(tags)
+            RecipeIngredient.objects.bulk_create([
+                RecipeIngredient(
+                    recipe=recipe,
+                    ingredient=ingredient,
+                    amount=number + 1
+                )
+                for ingredient in ingredients
+            ])
+            if number % 2:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+            if number % 3:
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def count_queries(self, limit):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(RECIPES_URL, {'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), limit)
+        return len(queries)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        # Первый запрос заполняет кэши справочников и подписок.
+        self.count_queries(1)
+        expected = self.count_queries(2)
+        for limit in (6, 12):
+            with self.subTest(limit=limit):
+                with self.assertNumQueries(expected):
+                    self.client.get(RECIPES_URL, {'limit': limit})
+
+    def test_user_flags_are_annotated(self):
+        response = self.client.get(RECIPES_URL, {'limit': 12})
+        recipes = {
+            recipe['name']: recipe for recipe in response.data['results']
+        }
+        self.assertTrue(recipes['recipe1']['is_favorited'])
+        self.assertFalse(recipes['recipe2']['is_favorited'])
+        self.assertTrue(recipes['recipe2']['is_in_shopping_cart'])
+        self.assertFalse(recipes['recipe3']['is_in_shopping_cart'])
+        self.assertTrue(recipes['recipe3']['author']['is_subscribed'])
+        self.assertFalse(recipes['recipe1']['author']['is_subscribed'])
+
+
+class RecipeCursorPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password'
+        )
+        recipes = [
+            Recipe.objects.create(
+                author=cls.user,
+                name=f'recipe{number}',
+                cooking_time=10,
+                text='text'
+            )
+            for number in range(7)
+        ]
+        # Одинаковые даты публикации проверяют сравнение по id.
+        Recipe.objects.filter(
+            pk__in=[recipe.pk for recipe in recipes[:4]]
+        ).update(pub_date=recipes[0].pub_date)
+        cls.expected = list(Recipe.objects.order_by(
+            '-pub_date', '-id'
+        ).values_list('pk', flat=True))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_cursor_walks_all_recipes_once(self):
+        seen = []
+        url = f'{RECIPES_URL}?cursor=&limit=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(recipe['id'] for recipe in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, self.expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(RECIPES_URL, {'cursor': 'broken'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_rejects_other_orderings(self):
+        for params in (
+            {'ordering': 'popular'},
+            {'ordering': 'trending'},
+            {'ordering': '-favorites_count'},
+            {'ordering': 'pub_date'},
+            {'search': 'recipe'},
+        ):
+            with self.subTest(params=params):
+                response = self.client.get(
+                    RECIPES_URL,
+                    {'cursor': '', **params}
+                )
+                self.assertEqual(response.status_code, 400)
+
+    def test_cursor_accepts_own_ordering(self):
+        response = self.client.get(
+            RECIPES_URL,
+            {'cursor': '', 'ordering': '-pub_date'}
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(ALLOWED_HOSTS=['good.example', 'evil.example'])
+class AnonymousResponseCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password'
+        )
+        for number in range(3):
+            Recipe.objects.create(
+                author=author,
+                name=f'recipe{number}',
+                cooking_time=10,
+                text='text'
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def get_next(self, host):
+        response = self.client.get(
+            RECIPES_URL,
+            {'limit': 2},
+            HTTP_HOST=host
+        )
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)['next']
+
+    def test_pagination_links_use_own_host(self):
+        self.assertTrue(
+            self.get_next('evil.example').startswith('http://evil.example/')
+        )
+        self.assertTrue(
+            self.get_next('good.example').startswith('http://good.example/')
+        )
+
+    def test_unknown_host_is_rejected(self):
+        response = self.client.get(RECIPES_URL, HTTP_HOST='other.example')
+        self.assertEqual(response.status_code, 400)
+
+
+class RecipeScoreOrderingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password'
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.user,
+                name=f'recipe{number}',
+                cooking_time=10,
+                text='text'
+            )
+            for number in range(4)
+        ]
+        for popularity, recipe in enumerate(cls.recipes[:2], start=1):
+            RecipeScore.objects.filter(recipe=recipe).update(
+                popularity=popularity,
+                trending=popularity
+            )
+        # Рецепты, созданные до появления оценок, не имеют строки RecipeScore.
+        RecipeScore.objects.filter(
+            recipe__in=cls.recipes[2:]
+        ).delete()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_recipes_without_score_are_listed_last(self):
+        expected = [
+            self.recipes[1].pk,
+            self.recipes[0].pk,
+            self.recipes[3].pk,
+            self.recipes[2].pk,
+        ]
+        for ordering in ('popular', 'trending'):
+            with self.subTest(ordering=ordering):
+                response = self.client.get(
+                    RECIPES_URL,
+                    {'ordering': ordering}
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data['count'], 4)
+                self.assertEqual(
+                    [recipe['id'] for recipe in response.data['results']],
+                    expected
+                )
+
+
+class IngredientIndexTest(TestCase):
+    def make_snapshot(self, *names):
+        return Snapshot([
+            {'id': number, 'name': name, 'measurement_unit': 'g'}
+            for number, name in enumerate(names, start=1)
+        ])
+
+    def search(self, index, snapshot, prefix):
+        with mock.patch(
+            'recipes.autocomplete.ingredient_reference'
+        ) as reference:
+            reference.get_snapshot.return_value = snapshot
+            return [item['name'] for item in index.search(prefix)]
+
+    def test_search_by_prefix(self):
+        index = IngredientIndex()
+        snapshot = self.make_snapshot('Сахар', 'соль', 'Сало', 'мука')
+        self.assertEqual(
+            self.search(index, snapshot, 'са'),
+            ['Сало', 'Сахар']
+        )
+        self.assertEqual(self.search(index, snapshot, 'х'), [])
+
+    def test_new_snapshot_replaces_keys_and_items_together(self):
+        index = IngredientIndex()
+        self.search(index, self.make_snapshot('соль', 'сахар'), 'с')
+        snapshot = self.make_snapshot('мёд')
+        self.assertEqual(self.search(index, snapshot, 'с'), [])
+        self.assertEqual(self.search(index, snapshot, 'м'), ['мёд'])
+
+
+class BulkRecipesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader',
+            email='reader@example.com',
+            password='password'
+        )
+        cls.other = User.objects.create_user(
+            username='other',
+            email='other@example.com',
+            password='password'
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.other,
+                name=f'recipe{number}',
+                cooking_time=10,
+                text='text'
+            )
+            for number in range(3)
+        ]
+        cls.missing_id = cls.recipes[-1].pk + 100
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def change(self, method, url, recipes):
+        response = getattr(self.client, method)(
+            url,
+            {'recipes': recipes},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return [
+            (result['id'], result['status'])
+            for result in response.data['results']
+        ]
+
+    def get_counters(self, field):
+        return list(Recipe.objects.filter(
+            pk__in=[recipe.pk for recipe in self.recipes]
+        ).order_by('pk').values_list(field, flat=True))
+
+    def test_add_and_remove(self):
+        first, second, third = (recipe.pk for recipe in self.recipes)
+        for model, url, field in (
+            (Favorite, f'{RECIPES_URL}favorite/', 'favorites_count'),
+            (ShoppingCart, f'{RECIPES_URL}shopping_cart/', 'in_carts_count'),
+        ):
+            with self.subTest(model=model.__name__):
+                model.objects.create(user=self.user, recipe_id=first)
+                model.objects.create(user=self.other, recipe_id=second)
+                self.assertEqual(self.get_counters(field), [1, 1, 0])
+                self.assertEqual(
+                    self.change(
+                        'post',
+                        url,
+                        [first, second, self.missing_id]
+                    ),
+                    [
+                        (first, 'exists'),
+                        (second, 'added'),
+                        (self.missing_id, 'not_found'),
+                    ]
+                )
+                self.assertEqual(self.get_counters(field), [1, 2, 0])
+                self.assertEqual(
+                    self.change(
+                        'delete',
+                        url,
+                        [second, third, self.missing_id]
+                    ),
+                    [
+                        (second, 'removed'),
+                        (third, 'missing'),
+                        (self.missing_id, 'not_found'),
+                    ]
+                )
+                self.assertEqual(self.get_counters(field), [1, 1, 0])
+                self.assertEqual(
+                    set(model.objects.values_list('user_id', 'recipe_id')),
+                    {(self.user.pk, first), (self.other.pk, second)}
+                )
+
+    def test_single_add_and_remove(self):
+        url = f'{RECIPES_URL}{self.recipes[0].pk}/favorite/'
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.get_counters('favorites_count'), [1, 0, 0])
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+        self.assertEqual(self.get_counters('favorites_count'), [0, 0, 0])
+
+
+class ShoppingListAggregateTest(TransactionTestCase):
+    """
+    ShoppingListItem совпадает с суммой по корзине после каждого изменения.
+
+    Пересчёт выполняется после фиксации транзакции, поэтому тест работает
+    без общей транзакции TestCase.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password'
+        )
+        self.reader = User.objects.create_user(
+            username='reader',
+            email='reader@example.com',
+            password='password'
+        )
+        self.ingredients = [
+            Ingredient.objects.create(
+                name=f'ingredient{number}',
+                measurement_unit='g'
+            )
+            for number in range(4)
+        ]
+        self.recipes = []
+        for number in range(3):
+            recipe = Recipe.objects.create(
+                author=self.author,
+                name=f'recipe{number}',
+                cooking_time=10,
+                text='text'
+            )
+            RecipeIngredient.objects.bulk_create([
+                RecipeIngredient(
+                    recipe=recipe,
+                    ingredient=ingredient,
+                    amount=(number + 1) * 10 + position
+                )
+                for position, ingredient in enumerate(
+                    self.ingredients[number:number + 2]
+                )
+            ])
+            self.recipes.append(recipe)
+        self.clients = {}
+        for user in (self.author, self.reader):
+            self.clients[user] = APIClient()
+            self.clients[user].force_authenticate(user)
+
+    def assert_list_is_fresh(self, user):
+        expected = dict(RecipeIngredient.objects.filter(
+            recipe__shopping_cart__user=user
+        ).order_by().values('ingredient_id').annotate(
+            total=Sum('amount')
+        ).values_list('ingredient_id', 'total'))
+        self.assertEqual(
+            dict(ShoppingListItem.objects.filter(user=user).values_list(
+                'ingredient_id', 'total_amount'
+            )),
+            expected
+        )
+
+    def cart_url(self, recipe=None):
+        if recipe is None:
+            return f'{RECIPES_URL}shopping_cart/'
+        return f'{RECIPES_URL}{recipe.pk}/shopping_cart/'
+
+    def test_single_cart_changes(self):
+        client = self.clients[self.reader]
+        for recipe in self.recipes[:2]:
+            self.assertEqual(
+                client.post(self.cart_url(recipe)).status_code,
+                201
+            )
+            self.assert_list_is_fresh(self.reader)
+        self.assertEqual(
+            client.delete(self.cart_url(self.recipes[0])).status_code,
+            204
+        )
+        self.assert_list_is_fresh(self.reader)
+        self.assertTrue(ShoppingListItem.objects.filter(
+            user=self.reader
+        ).exists())
+
+    def test_bulk_cart_changes(self):
+        client = self.clients[self.reader]
+        recipe_ids = [recipe.pk for recipe in self.recipes]
+        response = client.post(
+            self.cart_url(),
+            {'recipes': recipe_ids},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assert_list_is_fresh(self.reader)
+        response = client.delete(
+            self.cart_url(),
+            {'recipes': recipe_ids[:2]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assert_list_is_fresh(self.reader)
+        response = client.delete(
+            self.cart_url(),
+            {'recipes': recipe_ids[2:]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assert_list_is_fresh(self.reader)
+        self.assertFalse(ShoppingListItem.objects.filter(
+            user=self.reader
+        ).exists())
+
+    def test_recipe_ingredient_edit(self):
+        for user in (self.author, self.reader):
+            for recipe in self.recipes[:2]:
+                ShoppingCart.objects.create(user=user, recipe=recipe)
+        recipe = self.recipes[0]
+        first, second, _, fourth = self.ingredients
+        response = self.clients[self.author].patch(
+            f'{RECIPES_URL}{recipe.pk}/',
+            {'ingredients': [
+                {'id': first.pk, 'amount': 99},
+                {'id': fourth.pk, 'amount': 7},
+            ]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(recipe.recipeingredient_set.filter(
+            ingredient=second
+        ).exists())
+        for user in (self.author, self.reader):
+            with self.subTest(user=user.username):
+                self.assert_list_is_fresh(user)
+
+
+class RecipeIngredientsUpdateTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password'
+        )
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'ingredient{number}',
+                measurement_unit='g'
+            )
+            for number in range(4)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+        self.recipe = Recipe.objects.create(
+            author=self.author,
+            name='recipe',
+            cooking_time=10,
+            text='text'
+        )
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
+                recipe=self.recipe,
+                ingredient=ingredient,
+                amount=10
+            )
+            for ingredient in self.ingredients[:3]
+        ])
+        self.rows = self.get_rows()
+
+    def get_rows(self):
+        return {
+            ingredient_id: (pk, amount)
+            for pk, ingredient_id, amount in RecipeIngredient.objects.filter(
+                recipe=self.recipe
+            ).values_list('pk', 'ingredient_id', 'amount')
+        }
+
+    def patch(self, amounts):
+        response = self.client.patch(
+            f'{RECIPES_URL}{self.recipe.pk}/',
+            {'ingredients': [
+                {'id': ingredient.pk, 'amount': amount}
+                for ingredient, amount in amounts
+            ]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return self.get_rows()
+
+    def test_unchanged_ingredients_keep_rows(self):
+        rows = self.patch(
+            [(ingredient, 10) for ingredient in self.ingredients[:3]]
+        )
+        self.assertEqual(rows, self.rows)
+
+    def test_changed_amount_updates_row_in_place(self):
+        first, second, third, _ = self.ingredients
+        rows = self.patch([(first, 25), (second, 10), (third, 10)])
+        self.assertEqual(rows[first.pk], (self.rows[first.pk][0], 25))
+        self.assertEqual(rows[second.pk], self.rows[second.pk])
+        self.assertEqual(rows[third.pk], self.rows[third.pk])
+
+    def test_added_and_removed_ingredients(self):
+        first, second, third, fourth = self.ingredients
+        rows = self.patch([(first, 10), (third, 10), (fourth, 5)])
+        self.assertEqual(set(rows), {first.pk, third.pk, fourth.pk})
+        self.assertEqual(rows[first.pk], self.rows[first.pk])
+        self.assertEqual(rows[third.pk], self.rows[third.pk])
+        self.assertEqual(rows[fourth.pk][1], 5)
+        self.assertNotIn(
+            rows[fourth.pk][0],
+            {pk for pk, _ in self.rows.values()}
+        )
+
+
+class RecipeCreateTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password'
+        )
+        cls.tag = Tag.objects.create(name='tag', color='#000000', slug='tag')
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'ingredient{number}',
+                measurement_unit='g'
+            )
+            for number in range(2)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def create(self, ingredients):
+        return self.client.post(
+            RECIPES_URL,
+            {
+                'name': 'recipe',
+                'text': 'text',
+                'cooking_time': 10,
+                'tags': [self.tag.pk],
+                'ingredients': [
+                    {'id': ingredient.pk, 'amount': 10}
+                    for ingredient in ingredients
+                ],
+            },
+            format='json'
+        )
+
+    def assert_nothing_created(self):
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(Recipe.tags.through.objects.exists())
+        self.assertFalse(RecipeIngredient.objects.exists())
+
+    def test_create(self):
+        response = self.create(self.ingredients)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(RecipeIngredient.objects.count(), 2)
+
+    def test_duplicate_ingredients_are_rejected(self):
+        response = self.create([self.ingredients[0], self.ingredients[0]])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ingredients', response.data)
+        self.assert_nothing_created()
+
+    def test_failure_rolls_back_recipe_tags_and_ingredients(self):
+        with mock.patch.object(
+            RecipeIngredient.objects,
+            'bulk_create',
+            side_effect=DatabaseError
+        ):
+            with self.assertRaises(DatabaseError):
+                self.create(self.ingredients)
+        self.assert_nothing_created()
@@ -1,24 +1,135 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters, status, viewsets
+from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.generics import get_object_or_404
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
-from recipes.services import get_pdf
-from .filters import IngredientFilter, RecipeFilter
-from .models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from api.pagination import KeysetPagination
+from recipes.autocomplete import ingredient_index
+from recipes.bulk import add_recipes, lock_user, remove_recipes
+from recipes.matching import recipe_matching_index
+from recipes.reference import ingredient_reference, tag_reference
+from recipes.response_cache import (
+    get_detail_key,
+    get_entry,
+    get_list_key,
+    set_entry
+)
+from recipes.services import ExportFormat, export_shopping_list
+from users.models import User
+from .filters import IngredientFilter, RecipeFilter, RecipeOrderingFilter
+from .models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag
+)
 from .permissions import OwnerOrReadOnly
 from .serializers import (
     FavoriteSerializer,
     IngredientSerializer,
+    RecipeIdsSerializer,
     RecipeSerializer,
     RecipeViewSerializer,
+    ShoppingListItemSerializer,
     TagSerializer
 )
 
 
-class TagsViewSet(viewsets.ModelViewSet):
+class ReferenceDataMixin:
+    """Отдаёт справочник из кэша готовым JSON с поддержкой ETag."""
+
+    reference = None
+
+    def list(self, request, *args, **kwargs):
+        snapshot = self.reference.get_snapshot()
+        response = get_conditional_response(request, etag=snapshot.etag)
+        if response is None:
+            response = HttpResponse(
+                snapshot.payload,
+                content_type='application/json'
+            )
+        response['ETag'] = snapshot.etag
+        return response
+
+    def retrieve(self, request, pk=None, *args, **kwargs):
+        try:
+            return Response(self.reference.get_snapshot().by_id[int(pk)])
+        except (KeyError, ValueError):
+            raise NotFound
+
+
+class AnonymousCacheMixin:
+    """
+    Кэш готовых JSON-ответов list и retrieve для анонимных пользователей.
+
+    Ответ анонимному пользователю не зависит от того, кто его запросил,
+    поэтому тело ответа кэшируется по нормализованным параметрам запроса
+    и версиям данных из recipes.response_cache и отдаётся с ETag.
+    """
+
+    def get_cached_response(self, request, key, get_response):
+        entry = get_entry(key)
+        if entry is None:
+            response = get_response()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            entry = set_entry(key, request.accepted_renderer.render(
+                response.data,
+                request.accepted_media_type,
+                self.get_renderer_context()
+            ))
+        payload, etag = entry
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(
+                payload,
+                content_type='application/json'
+            )
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def is_cacheable(self, request):
+        return (request.user.is_anonymous
+                and request.accepted_renderer.format == 'json')
+
+    def list(self, request, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return super().list(request, *args, **kwargs)
+        return self.get_cached_response(
+            request,
+            get_list_key(request),
+            partial(super().list, request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            recipe_id = int(kwargs[self.lookup_field])
+        except ValueError:
+            raise NotFound
+        if not self.is_cacheable(request):
+            return super().retrieve(request, *args, **kwargs)
+        return self.get_cached_response(
+            request,
+            get_detail_key(request, recipe_id),
+            partial(super().retrieve, request, *args, **kwargs)
+        )
+
+
+class TagsViewSet(ReferenceDataMixin, viewsets.ModelViewSet):
+    reference = tag_reference
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
@@ -26,7 +137,8 @@ class TagsViewSet(viewsets.ModelViewSet):
     http_method_names = ['get']
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(ReferenceDataMixin, viewsets.ModelViewSet):
+    reference = ingredient_reference
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (AllowAny,)
@@ -36,14 +148,30 @@ class IngredientViewSet(viewsets.ModelViewSet):
     pagination_class = None
     http_method_names = ['get']
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return Response(ingredient_index.search(name))
+        return super().list(request, *args, **kwargs)
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(AnonymousCacheMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeViewSerializer
-    filter_backends = (DjangoFilterBackend, filters.OrderingFilter)
+    filter_backends = (DjangoFilterBackend, RecipeOrderingFilter)
     permission_classes = (OwnerOrReadOnly,)
     filterset_class = RecipeFilter
-    ordering_fields = ('-pub_date',)
+    ordering_fields = ('pub_date', 'favorites_count', 'in_carts_count')
+
+    def get_queryset(self):
+        user = self.request.user
+        return Recipe.objects.with_user_flags(user).prefetch_related(
+            Prefetch(
+                'author',
+                queryset=User.objects.with_is_subscribed(user)
+            ),
+            'recipeingredient_set__ingredient',
+        )
 
     def get_serializer_class(self):
         if self.request.method in ('POST', 'PATCH', 'DELETE'):
@@ -53,8 +181,10 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @transaction.atomic
     def delete_fav_or_shoplist(self, model, user, pk):
         recipe = get_object_or_404(Recipe, id=pk)
+        lock_user(user)
         obj = get_object_or_404(
             model,
             user=user,
@@ -66,8 +196,10 @@ class RecipeViewSet(viewsets.ModelViewSet):
             status=status.HTTP_204_NO_CONTENT,
         )
 
+    @transaction.atomic
     def post_fav_or_shoplist(self, model, user, pk):
         recipe = get_object_or_404(Recipe, id=pk)
+        lock_user(user)
         model.objects.get_or_create(
             user=user,
             recipe=recipe
@@ -103,10 +235,145 @@ class RecipeViewSet(viewsets.ModelViewSet):
         user = request.user
         return self.delete_fav_or_shoplist(ShoppingCart, user, pk)
 
+    def change_fav_or_shoplist_bulk(self, change, model, request):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({'results': change(
+            model,
+            request.user,
+            serializer.validated_data['recipes']
+        )})
+
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='favorite',
+        permission_classes=(IsAuthenticated,),
+    )
+    def favorite_bulk(self, request):
+        return self.change_fav_or_shoplist_bulk(add_recipes, Favorite, request)
+
+    @favorite_bulk.mapping.delete
+    def delete_favorite_bulk(self, request):
+        return self.change_fav_or_shoplist_bulk(
+            remove_recipes,
+            Favorite,
+            request
+        )
+
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='shopping_cart',
+        permission_classes=(IsAuthenticated,),
+    )
+    def shopping_cart_bulk(self, request):
+        return self.change_fav_or_shoplist_bulk(
+            add_recipes,
+            ShoppingCart,
+            request
+        )
+
+    @shopping_cart_bulk.mapping.delete
+    def delete_shopping_cart_bulk(self, request):
+        return self.change_fav_or_shoplist_bulk(
+            remove_recipes,
+            ShoppingCart,
+            request
+        )
+
+    @action(
+        detail=False,
+        methods=['GET'],
+        permission_classes=(IsAuthenticated,),
+        pagination_class=KeysetPagination,
+    )
+    def feed(self, request):
+        queryset = self.filter_queryset(self.get_queryset().filter(
+            author__followed__follower=request.user
+        ))
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=['GET'],
+    )
+    def cook(self, request):
+        """Рецепты, которые можно приготовить из указанных ингредиентов."""
+        params = request.query_params
+        try:
+            ingredient_ids = [
+                int(ingredient_id)
+                for value in params.getlist('ingredients')
+                for ingredient_id in value.split(',') if ingredient_id
+            ]
+            min_match = int(params.get('min_match', 1))
+            max_cooking_time = params.get('max_cooking_time')
+            if max_cooking_time is not None:
+                max_cooking_time = int(max_cooking_time)
+        except ValueError:
+            return Response(
+                {'errors': 'Ingredients and limits must be integers.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not ingredient_ids:
+            return Response(
+                {'errors': 'Choose at least one ingredient.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        slugs = set(params.getlist('tags'))
+        tag_ids = [
+            tag['id'] for tag in tag_reference.get_snapshot().rows
+            if tag['slug'] in slugs
+        ]
+        matches = []
+        if tag_ids or not slugs:
+            matches = recipe_matching_index.match(
+                ingredient_ids,
+                min_match=min_match,
+                tag_ids=tag_ids,
+                max_cooking_time=max_cooking_time,
+            )
+        page = self.paginate_queryset(matches)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in page]
+        )
+        page = [match for match in page if match[0] in recipes]
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for recipe_id, _, _ in page],
+            many=True
+        )
+        data = serializer.data
+        for item, (_, matched, total) in zip(data, page):
+            item['matched_ingredients'] = matched
+            item['total_ingredients'] = total
+        return self.get_paginated_response(data)
+
+    @action(
+        detail=False,
+        methods=['GET'],
+        permission_classes=(IsAuthenticated,),
+        pagination_class=None,
+    )
+    def shopping_list(self, request):
+        items = ShoppingListItem.objects.filter(
+            user=request.user
+        ).select_related('ingredient').order_by('ingredient__name')
+        return Response(ShoppingListItemSerializer(items, many=True).data)
+
     @action(
         detail=False,
         methods=['GET'],
     )
     def download_shopping_cart(self, request):
-        user = request.user
-        return get_pdf(user)
+        if request.user.is_anonymous:
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+        export_format = request.query_params.get('type', ExportFormat.PDF)
+        if export_format not in ExportFormat.CONTENT_TYPES:
+            return Response(
+                {'errors': 'Unknown shopping list format.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return export_shopping_list(request.user, export_format)
@@ -7,6 +7,13 @@ EMPTY_VALUE = '-none-'
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
+    list_display = (
+        'id',
+        'username',
+        'email',
+        'recipes_count',
+        'followers_count',
+    )
     search_fields = (
         'username',
         'role',
@@ -0,0 +1,142 @@
+import hashlib
+import time
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router, transaction
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from foodgram.metrics import registry
+from .models import User
+
+TOKEN_CACHE_TIMEOUT = getattr(settings, 'TOKEN_CACHE_TIMEOUT', 60 * 5)
+TOKEN_CACHE_LOCAL_TIMEOUT = getattr(settings, 'TOKEN_CACHE_LOCAL_TIMEOUT', 5)
+TOKEN_CACHE_LOCAL_SIZE = 10000
+# Хэш пароля не должен попадать в общий кэш, а счётчики и время входа
+# меняются без сохранения пользователя. Эти поля не кэшируются и при
+# обращении к ним загружаются из БД.
+DEFERRED_FIELDS = ('password', 'last_login') + User.counter_fields
+SNAPSHOT_FIELDS = tuple(
+    field.attname for field in User._meta.concrete_fields
+    if field.name not in DEFERRED_FIELDS
+)
+
+registry.describe_counter(
+    'token_cache',
+    'result',
+    'Token authentications by cache result.'
+)
+
+
+def get_cache_key(key):
+    return f'auth:token:{hashlib.sha256(key.encode()).hexdigest()}'
+
+
+class LocalTokenCache:
+    """
+    Снимки пользователей по токенам в памяти процесса.
+
+    Другие воркеры не узнают об инвалидации, поэтому записи живут лишь
+    TOKEN_CACHE_LOCAL_TIMEOUT секунд: столько после выхода пользователя
+    его токен ещё может приниматься.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._entries = {}
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def set(self, key, values):
+        with self._lock:
+            if len(self._entries) >= TOKEN_CACHE_LOCAL_SIZE:
+                self._entries.clear()
+            self._entries[key] = (
+                time.monotonic() + TOKEN_CACHE_LOCAL_TIMEOUT,
+                values
+            )
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+
+local_token_cache = LocalTokenCache()
+
+
+def invalidate_tokens(keys):
+    """Удаление снимков после фиксации транзакции."""
+    keys = list(keys)
+    if not keys:
+        return
+
+    def delete():
+        local_token_cache.delete_many(keys)
+        cache.delete_many([get_cache_key(key) for key in keys])
+
+    transaction.on_commit(delete)
+
+
+def invalidate_user_tokens(user_ids):
+    """
+    Удаление снимков всех токенов пользователей user_ids.
+
+    QuerySet.update() не посылает post_save, поэтому код, меняющий так
+    is_active, пароль или другие поля снимка, вызывает эту функцию сам.
+    Остальные изменения снимки переживут не дольше TOKEN_CACHE_TIMEOUT.
+    """
+    invalidate_tokens(Token.objects.filter(
+        user_id__in=user_ids
+    ).values_list('key', flat=True))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication без запроса к БД для недавно виденных токенов.
+
+    Снимок пользователя ищется сначала в памяти процесса, затем в кэше
+    Django, и только при промахе токен читается из БД. Снимки удаляются
+    сигналами при удалении токена и при сохранении пользователя, а после
+    QuerySet.update() - вызовом invalidate_user_tokens(). Неактивный
+    пользователь не проходит проверку и по снимку.
+    """
+
+    def authenticate_credentials(self, key):
+        values = local_token_cache.get(key)
+        if values is not None:
+            registry.increment('token_cache', 'local_hit')
+            return self.build(key, values)
+        values = cache.get(get_cache_key(key))
+        if values is not None:
+            registry.increment('token_cache', 'shared_hit')
+            local_token_cache.set(key, values)
+            return self.build(key, values)
+        registry.increment('token_cache', 'miss')
+        user, token = super().authenticate_credentials(key)
+        values = tuple(getattr(user, name) for name in SNAPSHOT_FIELDS)
+        cache.set(get_cache_key(key), values, TOKEN_CACHE_TIMEOUT)
+        local_token_cache.set(key, values)
+        return user, token
+
+    @staticmethod
+    def build(key, values):
+        user = User.from_db(router.db_for_read(User), SNAPSHOT_FIELDS, values)
+        if not user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+        token = Token.from_db(
+            router.db_for_read(Token),
+            ('key', 'user_id'),
+            (key, user.pk)
+        )
+        token.user = user
+        return user, token
@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from recipes.reference import CacheVersion
+from .models import Follow
+
+FOLLOW_GRAPH_CACHE_TIMEOUT = getattr(
+    settings,
+    'FOLLOW_GRAPH_CACHE_TIMEOUT',
+    60 * 60
+)
+
+
+class FollowGraph:
+    """
+    Подписки пользователей с множествами авторов в кэше Django.
+
+    Множество id авторов, на которых подписан пользователь, читается из
+    БД одним запросом и кэшируется до изменения его подписок, поэтому
+    проверки подписки и взаимной подписки выполняются в памяти. Ключ
+    множества содержит версию подписок пользователя, которая меняется
+    после фиксации изменения: множество, прочитанное до изменения и
+    записанное после него, ложится под старый ключ и больше не читается.
+    """
+
+    key = 'follow:followees:{user_id}:{version}'
+
+    @staticmethod
+    def get_version(user_id):
+        return CacheVersion(
+            f'follow:followees:{user_id}:version',
+            FOLLOW_GRAPH_CACHE_TIMEOUT
+        )
+
+    def get_followees(self, user_id):
+        key = self.key.format(
+            user_id=user_id,
+            version=self.get_version(user_id).get()
+        )
+        followees = cache.get(key)
+        if followees is None:
+            followees = frozenset(Follow.objects.filter(
+                follower_id=user_id
+            ).values_list('author_id', flat=True))
+            cache.set(key, followees, FOLLOW_GRAPH_CACHE_TIMEOUT)
+        return followees
+
+    def is_following(self, follower_id, author_id):
+        return author_id in self.get_followees(follower_id)
+
+    def is_mutual(self, user_id, other_id):
+        return (self.is_following(user_id, other_id)
+                and self.is_following(other_id, user_id))
+
+    def get_mutual(self, user_id):
+        """Id пользователей, подписанных друг на друга с user_id."""
+        return set(Follow.objects.filter(
+            author_id=user_id,
+            follower_id__in=self.get_followees(user_id)
+        ).values_list('follower_id', flat=True))
+
+    def invalidate(self, user_id):
+        """Смена версии подписок пользователя после фиксации транзакции."""
+        self.get_version(user_id).bump_on_commit()
+
+
+follow_graph = FollowGraph()
+
+
+def get_request_followees(request):
+    """Подписки текущего пользователя, загружаемые один раз за запрос."""
+    if not request.user.is_authenticated:
+        return frozenset()
+    if not hasattr(request, 'followees'):
+        request.followees = follow_graph.get_followees(request.user.pk)
+    return request.followees
@@ -1,9 +1,62 @@
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.core.validators import EmailValidator, RegexValidator
 from django.db import models
+from django.db.models import BooleanField, Exists, F, OuterRef, Value
 
 
-class User(AbstractUser):
+class UserQuerySet(models.QuerySet):
+    def with_is_subscribed(self, user):
+        """Аннотирует авторов флагом подписки на них пользователя user."""
+        if not user.is_authenticated:
+            return self.annotate(
+                is_subscribed=Value(False, output_field=BooleanField())
+            )
+        return self.annotate(is_subscribed=Exists(Follow.objects.filter(
+            follower=user,
+            author=OuterRef('pk')
+        )))
+
+
+class CustomUserManager(UserManager.from_queryset(UserQuerySet)):
+    pass
+
+
+def update_counter(queryset, field, delta):
+    """
+    Изменяет счётчик field на delta одним UPDATE через F-выражение.
+
+    Счётчик не уменьшается ниже нуля: строки, где он меньше -delta,
+    не обновляются.
+    """
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+class CounterFieldsMixin:
+    """
+    Исключает счётчики counter_fields из save() уже сохранённой модели.
+
+    Счётчики обновляются через update_counter, и сохранение устаревшего
+    экземпляра не должно перезаписывать их значения. Отложенные поля
+    тоже не сохраняются, чтобы save() не загружал их из БД.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+
+class User(CounterFieldsMixin, AbstractUser):
     USER = 'user'
     MODERATOR = 'moderator'
     ADMIN = 'admin'
@@ -59,6 +112,19 @@ class User(AbstractUser):
         blank=True,
         help_text="Change the user's role."
     )
+    recipes_count = models.PositiveIntegerField(
+        'Recipes count',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        'Followers count',
+        default=0,
+        editable=False,
+    )
+
+    objects = CustomUserManager()
+    counter_fields = ('recipes_count', 'followers_count')
 
     class Meta:
         ordering = ('username',)
@@ -4,6 +4,7 @@ from rest_framework.validators import UniqueTogetherValidator
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from recipes.models import Recipe
 
+from .follow_graph import get_request_followees
 from .models import Follow, User
 
 
@@ -45,11 +46,9 @@ class CustomUserSerializer(UserSerializer):
         ]
 
     def get_is_subscribed(self, author):
-        user = self.context['request'].user.id
-        return Follow.objects.filter(
-            follower=user,
-            author=author
-        ).exists()
+        if hasattr(author, 'is_subscribed'):
+            return author.is_subscribed
+        return author.pk in get_request_followees(self.context['request'])
 
 
 class PasswordSerializer(serializers.ModelSerializer):
@@ -75,6 +74,7 @@ class FollowingRecipeSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_thumbnail',
             'cooking_time'
         )
 
@@ -107,19 +107,20 @@ class SubscriptionsSerializer(serializers.ModelSerializer):
         return data
 
     def get_recipes(self, author):
-        limit_recipes_show = 3
-        recipes = author.recipes.all()[:limit_recipes_show]
+        if hasattr(author, 'latest_recipes'):
+            recipes = author.latest_recipes
+        else:
+            limit_recipes_show = 3
+            recipes = author.recipes.all()[:limit_recipes_show]
         return FollowingRecipeSerializer(
             recipes,
             many=True
         ).data
 
     def get_is_subscribed(self, author):
-        user = self.context['request'].user.id
-        return Follow.objects.filter(
-            follower=user,
-            author=author
-        ).exists()
+        if hasattr(author, 'is_subscribed'):
+            return author.is_subscribed
+        return author.pk in get_request_followees(self.context['request'])
 
     def get_recipes_count(self, author):
-        return author.recipes.count()
+        return author.recipes_count
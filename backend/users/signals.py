@@ -0,0 +1,50 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from .authentication import (
+    SNAPSHOT_FIELDS,
+    invalidate_tokens,
+    invalidate_user_tokens
+)
+from .follow_graph import follow_graph
+from .models import Follow, User, update_counter
+
+
+@receiver(post_save, sender=Follow)
+def increment_followers_count(instance, created, **kwargs):
+    if created:
+        update_counter(
+            User.objects.filter(pk=instance.author_id),
+            'followers_count',
+            1
+        )
+
+
+@receiver(post_delete, sender=Follow)
+def decrement_followers_count(instance, **kwargs):
+    update_counter(
+        User.objects.filter(pk=instance.author_id),
+        'followers_count',
+        -1
+    )
+
+
+@receiver((post_save, post_delete), sender=Follow)
+def invalidate_follow_graph(instance, **kwargs):
+    follow_graph.invalidate(instance.follower_id)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(instance, **kwargs):
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+def invalidate_saved_user_tokens(instance, created, update_fields, **kwargs):
+    if created or (update_fields is not None and not {
+        User._meta.get_field(name).attname for name in update_fields
+    }.intersection(SNAPSHOT_FIELDS)):
+        return
+    invalidate_user_tokens([instance.pk])
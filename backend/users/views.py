@@ -1,3 +1,5 @@
+from django.db.models import OuterRef, Prefetch, Subquery
+
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.generics import get_object_or_404
@@ -5,7 +7,9 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
 from djoser.views import UserViewSet
+from recipes.models import Recipe
 
+from .follow_graph import follow_graph
 from .models import Follow, User
 from .serializers import (
     CustomUserSerializer,
@@ -13,10 +17,38 @@ from .serializers import (
     SubscriptionsSerializer
 )
 
+RECIPES_LIMIT_DEFAULT = 3
+
 
 class CustomUserViewSet(UserViewSet):
     queryset = User.objects.all()
     serializer_class = CustomUserSerializer
+    cursor_ordering = ('username', 'id')
+
+    def get_recipes_limit(self):
+        try:
+            limit = int(self.request.query_params['recipes_limit'])
+        except (KeyError, ValueError):
+            return RECIPES_LIMIT_DEFAULT
+        return max(limit, 0)
+
+    def get_subscriptions_queryset(self, user):
+        """
+        Авторы, на которых подписан user, с количеством рецептов и не более
+        чем recipes_limit последними рецептами каждого автора.
+        """
+        latest_recipes = Recipe.objects.filter(
+            author=OuterRef('author')
+        ).order_by('-pub_date').values('pk')[:self.get_recipes_limit()]
+        return User.objects.filter(
+            followed__follower=user
+        ).with_is_subscribed(user).prefetch_related(Prefetch(
+            'recipes',
+            queryset=Recipe.objects.filter(
+                pk__in=Subquery(latest_recipes)
+            ).order_by('-pub_date'),
+            to_attr='latest_recipes'
+        )).order_by('username')
 
     @action(
         detail=False,
@@ -75,7 +107,9 @@ class CustomUserViewSet(UserViewSet):
                 context=self.get_serializer_context()
             )
             return Response(serializer.to_representation(
-                instance=followed),
+                instance=self.get_subscriptions_queryset(follower).get(
+                    pk=followed.pk
+                )),
                 status=status.HTTP_201_CREATED
             )
         Follow.objects.filter(
@@ -83,6 +117,40 @@ class CustomUserViewSet(UserViewSet):
         ).delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=True,
+        methods=['GET'],
+        permission_classes=[IsAuthenticated]
+    )
+    def follow_stats(self, request, id):
+        author = get_object_or_404(User, id=id)
+        is_subscribed = follow_graph.is_following(request.user.pk, author.pk)
+        is_follower = follow_graph.is_following(author.pk, request.user.pk)
+        return Response({
+            'followers_count': author.followers_count,
+            'following_count': len(follow_graph.get_followees(author.pk)),
+            'is_subscribed': is_subscribed,
+            'is_follower': is_follower,
+            'is_mutual': is_subscribed and is_follower,
+        })
+
+    @action(
+        detail=False,
+        methods=['GET'],
+        permission_classes=[IsAuthenticated]
+    )
+    def mutual(self, request):
+        queryset = User.objects.filter(
+            pk__in=follow_graph.get_mutual(request.user.pk)
+        ).order_by('username')
+        pages = self.paginate_queryset(queryset)
+        serializer = CustomUserSerializer(
+            pages,
+            many=True,
+            context={'request': request}
+        )
+        return self.get_paginated_response(serializer.data)
+
     @action(
         detail=True,
         methods=['GET'],
@@ -90,8 +158,7 @@ class CustomUserViewSet(UserViewSet):
         url_path='subscriptions',
     )
     def subscriptions(self, request):
-        user = request.user
-        queryset = User.objects.filter(followed__follower=user)
+        queryset = self.get_subscriptions_queryset(request.user)
         pages = self.paginate_queryset(queryset)
         serializer = SubscriptionsSerializer(
             pages,